@@ -0,0 +1,200 @@
+"""
+Офлайн-бенчмарк и регрессионная проверка CryptoMonitor на записанных ответах провайдеров.
+
+    python -m benchmarks.bench_crypto_monitor
+    python -m benchmarks.bench_crypto_monitor --iterations 500 --latency-scale 0.5 --error-rate 0.05
+
+Отчет:
+  * стоимость разбора ответа по каждому чекеру: json.loads тела из записи и функция разбора, без HTTP-слоя;
+  * распределение задержки search_tx end-to-end (p50/p90/p99/max) с профилями задержек из записи.
+Если результат поиска не совпадает с "expect" из записи, скрипт завершается с кодом 1.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Для офлайн-запуска .env не нужен: Settings требует эти поля, но бенчмарк их не использует
+for _name in ("BOT_TOKEN", "EXTERNAL_API_URL", "BASE_API_URL", "DB_USER", "DB_PASSWORD", "DB_HOST", "DB_NAME"):
+    os.environ.setdefault(_name, "bench")
+
+from benchmarks.replay import ReplayTransport, load_recording  # noqa: E402
+from core.config import settings  # noqa: E402
+from services.crypto_monitor import CryptoMonitor  # noqa: E402
+from services.http_pool import http_pool  # noqa: E402
+from services.provider_health import ProviderHealth, PROVIDER_LIMITS  # noqa: E402
+from services.tx_cache import TxLookupCache  # noqa: E402
+
+DEFAULT_FIXTURES = Path(__file__).resolve().parent / "fixtures" / "providers.json"
+UNLIMITED = {"rate": 1e9, "burst": 10**9, "daily": None}
+
+
+def make_monitor(recording):
+    """CryptoMonitor без кэша и без rate limit, чтобы измерять сам поиск"""
+    hosts = set(PROVIDER_LIMITS) | set(recording.get("hosts", {}))
+    return CryptoMonitor(
+        cache=TxLookupCache(maxsize=0, found_ttl=0, not_found_ttl=0),
+        health=ProviderHealth(limits={host: UNLIMITED for host in hosts}),
+    )
+
+
+# Разбор ответа по сетям: сеть -> (URL ответа в записи, разбор(monitor, JSON ответа, tx_hash, кошелек)).
+# Те же функции, что вызывают чекеры CryptoMonitor после получения ответа
+PARSERS = {
+    "ethereum": (
+        lambda h: f"https://api.ethplorer.io/getTxInfo/{h}?apiKey=freekey",
+        lambda m, data, h, wallet: m._parse_ethplorer(data, wallet),
+    ),
+    "base": (
+        lambda h: f"https://api.blockchair.com/base/dashboards/transaction/{h}",
+        lambda m, data, h, wallet: m._parse_blockchair_evm(data["data"][h], "base", wallet),
+    ),
+    "bsc": (
+        lambda h: f"https://api.blockchair.com/binance-smart-chain/dashboards/transaction/{h}",
+        lambda m, data, h, wallet: m._parse_blockchair_evm(data["data"][h], "binance-smart-chain", wallet),
+    ),
+    "arbitrum": (
+        lambda h: f"https://api.blockchair.com/arbitrum/dashboards/transaction/{h}",
+        lambda m, data, h, wallet: m._parse_blockchair_evm(data["data"][h], "arbitrum", wallet),
+    ),
+    "polygon": (
+        lambda h: f"https://api.blockchair.com/polygon/dashboards/transaction/{h}",
+        lambda m, data, h, wallet: m._parse_blockchair_evm(data["data"][h], "polygon", wallet),
+    ),
+    "dogecoin": (
+        lambda h: f"https://api.blockchair.com/dogecoin/dashboards/transaction/{h}",
+        lambda m, data, h, wallet: m._parse_blockchair_doge(data["data"][h], wallet),
+    ),
+    "tron": (
+        lambda h: f"https://apilist.tronscan.org/api/transaction-info?hash={h}",
+        lambda m, data, h, wallet: m._parse_tron(data, wallet),
+    ),
+    "bitcoin": (
+        lambda h: f"https://blockchain.info/rawtx/{h}",
+        lambda m, data, h, wallet: m._parse_bitcoin(data, wallet),
+    ),
+    "ton": (
+        lambda h: f"https://tonapi.io/v2/events/{h}",
+        lambda m, data, h, wallet: m._parse_ton_event(data, wallet),
+    ),
+    "monero": (
+        lambda h: f"https://explorer.monero.ovh/api/transaction/{h}",
+        lambda m, data, h, wallet: m._parse_xmr(data),
+    ),
+}
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def check_result(case, res):
+    expect = case.get("expect")
+    if expect is None:
+        return res is None
+    return bool(res) and all(
+        abs(res[k] - v) < 1e-9 if isinstance(v, float) else res[k] == v for k, v in expect.items()
+    )
+
+
+def bench_parse(recording, iterations):
+    """Стоимость разбора записанного ответа: json.loads тела и функция разбора чекера, без HTTP-слоя"""
+    monitor = make_monitor(recording)
+    entries = {entry["url"]: entry for entry in recording["entries"]}
+
+    print(f"\n== Разбор ответов по чекерам ({iterations} итераций) ==")
+    print(f"{'сеть':<10} {'json, мкс':>10} {'разбор, мкс':>12}")
+    failures = 0
+    for case in recording["cases"]:
+        chain = case.get("chain")
+        if not chain:
+            continue
+        tx_hash, wallet = case["tx_hash"], case.get("target_wallet")
+        url_for, parse = PARSERS[chain]
+        entry = entries.get(url_for(tx_hash))
+        if entry is None:
+            print(f"{chain:<10} нет ответа в записи")
+            failures += 1
+            continue
+        body = json.dumps(entry.get("json")).encode()
+        data = json.loads(body)
+        res = parse(monitor, data, tx_hash, wallet)
+        if not check_result(case, res):
+            print(f"{chain:<10} НЕСОВПАДЕНИЕ: {res}")
+            failures += 1
+            continue
+
+        started = time.perf_counter()
+        for _ in range(iterations):
+            json.loads(body)
+        decode = (time.perf_counter() - started) / iterations
+        started = time.perf_counter()
+        for _ in range(iterations):
+            parse(monitor, data, tx_hash, wallet)
+        per_parse = (time.perf_counter() - started) / iterations
+        print(f"{chain:<10} {decode * 1e6:>10.1f} {per_parse * 1e6:>12.1f}")
+    return failures
+
+
+async def bench_search(recording, iterations, latency_scale, error_rate, timeout_rate, seed):
+    """Распределение задержки search_tx end-to-end с профилями задержек провайдеров"""
+    transport = ReplayTransport(recording, latency_scale, error_rate, timeout_rate, seed)
+    await http_pool.install_transport(transport)
+    monitor = make_monitor(recording)
+
+    print(f"\n== search_tx end-to-end ({iterations} итераций, масштаб задержек {latency_scale}, "
+          f"таймаут поиска {settings.TX_SEARCH_TIMEOUT} сек.) ==")
+    print(f"{'сеть':<10} {'p50, мс':>9} {'p90, мс':>9} {'p99, мс':>9} {'max, мс':>9} {'найдено':>8}")
+    failures = 0
+    all_samples = []
+    for case in recording["cases"]:
+        samples, matched = [], 0
+        for _ in range(iterations):
+            started = time.perf_counter()
+            res = await monitor.search_tx(case["tx_hash"], case.get("target_wallet"))
+            samples.append((time.perf_counter() - started) * 1000)
+            matched += check_result(case, res)
+        all_samples += samples
+        # С инъекцией ошибок промахи ожидаемы, без нее — это регрессия
+        if not error_rate and not timeout_rate and matched != iterations:
+            failures += 1
+        label = case.get("chain") or "промах"
+        print(f"{label:<10} {percentile(samples, 50):>9.1f} {percentile(samples, 90):>9.1f} "
+              f"{percentile(samples, 99):>9.1f} {max(samples):>9.1f} {matched:>4}/{iterations}")
+    print(f"\nМедиана по всем поискам: {statistics.median(all_samples):.1f} мс; "
+          f"ответов из записи: {transport.served}, без записи: {transport.unmatched}")
+    return failures
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", default=str(DEFAULT_FIXTURES))
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--search-iterations", type=int, default=30)
+    parser.add_argument("--latency-scale", type=float, default=1.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    recording = load_recording(args.fixtures)
+    try:
+        failures = bench_parse(recording, args.iterations)
+        failures += await bench_search(
+            recording, args.search_iterations, args.latency_scale, args.error_rate, args.timeout_rate, args.seed
+        )
+    finally:
+        await http_pool.install_transport(None)
+
+    if failures:
+        print(f"\n❌ Несовпадений с записью: {failures}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
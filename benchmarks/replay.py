@@ -0,0 +1,138 @@
+"""
+Запись и воспроизведение ответов блокчейн-провайдеров для офлайн-тестов и бенчмарков CryptoMonitor.
+
+Формат записи (JSON):
+{
+  "version": 1,
+  "default": {"status": 404, "json": {}},           # ответ на URL, которого нет в записи
+  "hosts": {                                        # профили по хостам (необязательно)
+    "api.blockchair.com": {"latency_ms": {"median": 250, "sigma": 0.5}, "error_rate": 0.02, "timeout_rate": 0.01}
+  },
+  "entries": [
+    {"url": "https://...", "status": 200, "json": {...},
+     "latency_ms": 120 | {"median": 120, "sigma": 0.3},   # необязательно, иначе профиль хоста
+     "error": null | "timeout" | "connect"}             # принудительная ошибка
+  ],
+  "cases": [                                        # контрольные поиски для бенчмарка и регрессии
+    {"chain": "tron", "tx_hash": "...", "target_wallet": "...", "expect": {...} | null}
+  ]
+}
+"""
+import asyncio
+import json
+import random
+import time
+import httpx
+
+RECORDING_VERSION = 1
+
+
+def load_recording(path):
+    with open(path, encoding="utf-8") as f:
+        recording = json.load(f)
+    if recording.get("version") != RECORDING_VERSION:
+        raise ValueError(f"Неподдерживаемая версия записи: {recording.get('version')}")
+    return recording
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """Транспорт httpx, отдающий записанные ответы с имитацией задержек, ошибок и таймаутов"""
+
+    def __init__(self, recording, latency_scale=1.0, error_rate=0.0, timeout_rate=0.0, seed=None):
+        self.entries = {entry["url"]: entry for entry in recording.get("entries", [])}
+        self.default = recording.get("default", {"status": 404, "json": {}})
+        self.hosts = recording.get("hosts", {})
+        self.latency_scale = latency_scale
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.random = random.Random(seed)
+        self.served = 0
+        self.unmatched = 0
+
+    def _latency(self, profile):
+        """Задержка в секундах: число (мс) или логнормальное распределение {median, sigma}"""
+        if not profile:
+            return 0.0
+        if isinstance(profile, dict):
+            ms = profile["median"] * self.random.lognormvariate(0, profile.get("sigma", 0.0))
+        else:
+            ms = float(profile)
+        return ms * self.latency_scale / 1000
+
+    def _injected_error(self, entry, host_profile):
+        if entry.get("error"):
+            return entry["error"]
+        roll = self.random.random()
+        timeout_rate = host_profile.get("timeout_rate", 0.0) + self.timeout_rate
+        error_rate = host_profile.get("error_rate", 0.0) + self.error_rate
+        if roll < timeout_rate:
+            return "timeout"
+        if roll < timeout_rate + error_rate:
+            return "http_500"
+        return None
+
+    async def handle_async_request(self, request):
+        entry = self.entries.get(str(request.url))
+        if entry is None:
+            self.unmatched += 1
+            entry = self.default
+        host_profile = self.hosts.get(request.url.host, {})
+
+        delay = self._latency(entry.get("latency_ms", host_profile.get("latency_ms")))
+        if delay:
+            await asyncio.sleep(delay)
+
+        error = self._injected_error(entry, host_profile)
+        if error == "timeout":
+            raise httpx.ReadTimeout("Injected timeout", request=request)
+        if error == "connect":
+            raise httpx.ConnectError("Injected connect error", request=request)
+        if error == "http_500":
+            return httpx.Response(500, json={}, request=request)
+
+        self.served += 1
+        return httpx.Response(
+            entry.get("status", 200),
+            headers=entry.get("headers"),
+            json=entry.get("json"),
+            request=request,
+        )
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """Транспорт httpx, проксирующий запросы в сеть и сохраняющий ответы в формате записи"""
+
+    def __init__(self, inner=None):
+        self.inner = inner or httpx.AsyncHTTPTransport()
+        self.entries = []
+
+    async def handle_async_request(self, request):
+        started = time.monotonic()
+        response = await self.inner.handle_async_request(request)
+        body = await response.aread()
+        entry = {
+            "url": str(request.url),
+            "status": response.status_code,
+            "latency_ms": round((time.monotonic() - started) * 1000, 1),
+        }
+        try:
+            entry["json"] = json.loads(body)
+        except ValueError:
+            entry["json"] = None
+        self.entries.append(entry)
+        # Тело уже распаковано, поэтому заголовки сжатия и длины не передаем дальше
+        headers = [(k, v) for k, v in response.headers.items() if k.lower() not in ("content-encoding", "content-length")]
+        return httpx.Response(response.status_code, headers=headers, content=body, request=request)
+
+    def dump(self, path, cases=None):
+        recording = {
+            "version": RECORDING_VERSION,
+            "default": {"status": 404, "json": {}},
+            "entries": self.entries,
+            "cases": cases or [],
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(recording, f, ensure_ascii=False, indent=2)
+
+    async def aclose(self):
+        await self.inner.aclose()
@@ -16,6 +16,105 @@ class Settings(BaseSettings):
     DB_NAME: str
     DB_PORT: int = 3306  
 
+    # Реплики для чтений, допускающих отставание: "host1:3307,host2" (те же пользователь и БД); пусто — все на primary
+    DB_REPLICA_HOSTS: str = ""
+    DB_REPLICA_POOL_MINSIZE: int = 1
+    DB_REPLICA_POOL_MAXSIZE: int = 10
+    # После записи чтения этого запроса еще столько секунд идут на primary (чтение своих записей)
+    DB_REPLICA_STICKY_SECONDS: float = 5.0
+
+    # Индексы под запросы репозитория (db/migrations.py): создавать при старте и проверять планы запросов
+    DB_APPLY_MIGRATIONS: bool = False
+    DB_CHECK_QUERY_PLANS: bool = True
+
+    # Получение обновлений Telegram: "polling" (getUpdates у лидера) или "webhook" (POST на WEBHOOK_PATH в этом приложении)
+    TELEGRAM_UPDATES_MODE: str = "polling"
+    WEBHOOK_URL: str = ""  # публичный адрес приложения, например https://ops.example.com
+    WEBHOOK_PATH: str = "/telegram/webhook"
+    WEBHOOK_SECRET: str = ""  # сверяется с заголовком X-Telegram-Bot-Api-Secret-Token, обязателен для webhook
+    # Свой сервер Bot API (локальный telegram-bot-api или фейковый для тестов); пусто — api.telegram.org
+    TELEGRAM_API_SERVER: str = ""
+
+    # Общий лимит времени на поиск транзакции по всем сетям (сек.)
+    TX_SEARCH_TIMEOUT: float = 25.0
+    # Параллельность запросов при пакетной проверке транзакций
+    TX_BATCH_CONCURRENCY: int = 5
+    # Максимум хэшей в одном запросе /transaction/verify-batch (после удаления повторов)
+    TX_BATCH_MAX_HASHES: int = 100
+    # Допустимое расхождение суммы перевода с ожидаемой
+    AMOUNT_TOLERANCE: float = 0.01
+
+    # Фоновое отслеживание входящих платежей на кошельки активных задач
+    WALLET_WATCH_ENABLED: bool = True
+    WALLET_WATCH_INTERVAL: float = 15.0
+    WALLET_WATCH_CONCURRENCY: int = 5
+
+    # HTTP пул для блокчейн-провайдеров
+    HTTP_MAX_CONNECTIONS_PER_HOST: int = 10
+    HTTP_KEEPALIVE_EXPIRY: float = 120.0
+    HTTP2_ENABLED: bool = True  # используется, только если установлен пакет h2
+    HTTP_PREWARM: bool = True
+
+    # Кэш результатов поиска транзакций
+    TX_CACHE_MAXSIZE: int = 10000
+    TX_CACHE_FOUND_TTL: float = 86400.0
+    TX_CACHE_NOT_FOUND_TTL: float = 60.0
+
+    # Здоровье провайдеров: ожидание токена rate limit и circuit breaker
+    PROVIDER_MAX_QUEUE_WAIT: float = 2.0
+    BREAKER_FAILURE_THRESHOLD: int = 5
+    BREAKER_WINDOW: float = 60.0
+    BREAKER_RECOVERY_TIMEOUT: float = 30.0
+
+    # Состояние операторов в памяти: период сверки с БД (онлайн-статус меняется вне приложения)
+    OPERATOR_RECONCILE_INTERVAL: float = 30.0
+    # Емкость сотрудника по умолчанию (см. ROLE_TASK_CAPACITY / EMPLOYEE_TASK_CAPACITY)
+    DEFAULT_TASK_CAPACITY: int = 1
+
+    # Привязка повторных расчетов по сделке к оператору и его топику
+    AFFINITY_CACHE_MAXSIZE: int = 10000
+    AFFINITY_TTL: float = 86400.0
+
+    # Справочник сотрудников в памяти: период дочитывания изменений (по updated_at, иначе полная перезагрузка)
+    EMPLOYEE_REFRESH_INTERVAL: float = 10.0
+
+    # Кэш строк CryptoDeals
+    DEAL_CACHE_MAXSIZE: int = 5000
+    DEAL_CACHE_TTL: float = 300.0
+
+    # Кэш тем клиентов в чате СБ
+    SECURITY_TOPIC_CACHE_MAXSIZE: int = 10000
+    SECURITY_TOPIC_CACHE_TTL: float = 86400.0
+
+    # Блокировка при назначении задач: "local" — asyncio.Lock в процессе (один воркер),
+    # "db" — именованная блокировка MySQL (GET_LOCK), чтобы несколько воркеров и хостов не назначали одновременно
+    ASSIGNMENT_LOCK_MODE: str = "local"
+    ASSIGNMENT_LOCK_TIMEOUT: float = 5.0
+
+    # Выбор лидера между воркерами: только лидер получает обновления Telegram и отслеживает кошельки.
+    # Выключено — процесс считает себя лидером сразу (один воркер)
+    LEADER_ELECTION_ENABLED: bool = False
+    LEADER_LOCK_NAME: str = "cryptoops:leader"
+    LEADER_HEARTBEAT_INTERVAL: float = 2.0
+
+    # Отложенная запись событий задач и кликов: очередь в памяти + spool-файл, запись в БД пачками
+    JOURNAL_SPOOL_DIR: str = os.path.join(BASE_DIR, "spool")
+    JOURNAL_MAX_QUEUE: int = 10000
+    JOURNAL_BATCH_SIZE: int = 500
+    JOURNAL_FLUSH_INTERVAL: float = 1.0
+
+    # Перенос завершенных задач старше RETENTION_DAYS и их событий в архивные таблицы (у лидера, пачками)
+    RETENTION_ENABLED: bool = False
+    RETENTION_DAYS: int = 90
+    RETENTION_BATCH_SIZE: int = 1000
+    RETENTION_BATCH_PAUSE: float = 0.5
+    RETENTION_INTERVAL: float = 3600.0
+
+    # Раздача общей очереди: период перечитывания очереди из БД
+    DISPATCH_RESYNC_INTERVAL: float = 60.0
+    # Пауза перед повторной раздачей, если доставить задачу оператору не удалось (без Retry-After от Telegram)
+    DISPATCH_RETRY_DELAY: float = 5.0
+
     model_config = SettingsConfigDict(
         env_file=os.path.join(BASE_DIR, ".env"),
         env_file_encoding='utf-8'
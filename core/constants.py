@@ -24,6 +24,33 @@ SECURITY_TO_GROUPS = {
     "7618917603": -1003864400045
 }
 
+# Сколько задач сотрудник может вести одновременно.
+# Порядок: персональное значение -> значение для роли -> settings.DEFAULT_TASK_CAPACITY
+ROLE_TASK_CAPACITY = {
+    "Operator": 1,
+    "Security": 1,
+}
+
+EMPLOYEE_TASK_CAPACITY = {
+    # "personal_telegram_id": N
+}
+
+# Контракты токенов, переводы которых WalletWatcher принимает как оплату (остальные токены игнорируются:
+# кто угодно может выпустить токен с символом USDT). Монеты сетей (BTC, ETH, TRX, TON) контракта не имеют
+TOKEN_CONTRACTS = {
+    "tron": {
+        "TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6t": "USDT",
+        "TEkxiTehnzSmSe2XqrBj4w32RUN966rdz8": "USDC",
+    },
+    "ethereum": {
+        "0xdac17f958d2ee523a2206206994597c13d831ec7": "USDT",
+        "0xa0b86991c6218b36c1d19d4a2e9eb0ce3606eb48": "USDC",
+    },
+    "ton": {
+        "0:b113a994b5024a16719f69139328eb759596c38a25f59028b146fecdc3621dfe": "USDT",
+    },
+}
+
 MANAGERS_TO_GROUPS = {
     "582035596": -1003884189249,
 }
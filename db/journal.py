@@ -0,0 +1,228 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import time
+from collections import deque
+from datetime import datetime
+from core.config import settings
+from db.session import db
+
+log = logging.getLogger(__name__)
+
+EVENT = "event"
+CLICK = "click"
+
+
+class WriteBehindJournal:
+    """
+    Отложенная запись событий задач (task_events) и времени клика (task_logs.clicked_at).
+    Обработчики только кладут запись в очередь в памяти и дописывают строку в локальный spool-файл;
+    фоновая задача пишет записи в БД пачками (executemany) по размеру пачки или по таймеру.
+    После успешной записи номер последней записи сохраняется в checkpoint; при старте записи из spool
+    после checkpoint пишутся повторно (доставка "хотя бы один раз").
+    Если очередь в памяти заполнена, запись остается только в spool и дочитывается оттуда позже.
+    """
+
+    def __init__(self, spool_dir: str, max_queue: int, batch_size: int, flush_interval: float):
+        self.spool_dir = spool_dir
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = deque()
+        self.seq = 0
+        self.spilled = False  # есть записи только в spool
+        self.spool_fd = None
+        self.spool_path = None
+        self.wakeup = asyncio.Event()
+        self.task = None
+        # Метрики
+        self.flushed = 0
+        self.batches = 0
+        self.errors = 0
+        self.overflows = 0
+        self.last_flush_at = None
+        self.last_flush_duration = None
+
+    # --- spool ---
+
+    def _open_spool(self):
+        """Занимает первый свободный spool-файл (по одному на воркер) через flock"""
+        os.makedirs(self.spool_dir, exist_ok=True)
+        slot = 0
+        while True:
+            path = os.path.join(self.spool_dir, f"journal-{slot}.spool")
+            fd = os.open(path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                slot += 1
+                continue
+            self.spool_fd, self.spool_path = fd, path
+            return
+
+    def _read_checkpoint(self) -> int:
+        try:
+            with open(self.spool_path + ".ckpt") as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _write_checkpoint(self, seq: int):
+        tmp = self.spool_path + ".ckpt.tmp"
+        with open(tmp, "w") as f:
+            f.write(str(seq))
+        os.replace(tmp, self.spool_path + ".ckpt")
+
+    def _read_spool(self, after_seq: int, limit: int = None):
+        records = []
+        with open(self.spool_path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # недописанная строка при аварийной остановке
+                if record["seq"] > after_seq:
+                    records.append(record)
+                    if limit and len(records) >= limit:
+                        break
+        return records
+
+    def _compact(self):
+        """Очередь пуста и все записано — spool можно обнулить"""
+        os.ftruncate(self.spool_fd, 0)
+        self._write_checkpoint(self.seq)
+
+    # --- запись ---
+
+    def _append(self, kind: str, task_id: int, ts: datetime):
+        self.seq += 1
+        record = {"seq": self.seq, "kind": kind, "task_id": task_id, "ts": ts.isoformat(), "at": time.time()}
+        if self.spool_fd is not None:
+            os.write(self.spool_fd, (json.dumps(record) + "\n").encode())
+        if len(self.queue) < self.max_queue and not self.spilled:
+            self.queue.append(record)
+        else:
+            self.spilled = True
+            self.overflows += 1
+        if len(self.queue) >= self.batch_size:
+            self.wakeup.set()
+
+    def record_event(self, task_id: int, event_type: str, event_time: datetime = None):
+        self._append(f"{EVENT}:{event_type}", task_id, event_time or datetime.now())
+
+    def record_click(self, task_id: int, clicked_at: datetime):
+        self._append(CLICK, task_id, clicked_at)
+
+    # --- фоновая запись в БД ---
+
+    async def start(self):
+        self._open_spool()
+        checkpoint = self._read_checkpoint()
+        pending = self._read_spool(checkpoint)
+        self.seq = max([checkpoint] + [r["seq"] for r in pending])
+        self.queue.extend(pending[:self.max_queue])
+        self.spilled = len(pending) > self.max_queue
+        if pending:
+            log.info(f"WriteBehindJournal: {len(pending)} записей из {self.spool_path} будут дописаны в БД")
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        try:
+            while self.queue or self.spilled:
+                if not await self.flush():
+                    break
+        finally:
+            if self.spool_fd is not None:
+                os.close(self.spool_fd)
+                self.spool_fd = None
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            while await self.flush() and len(self.queue) >= self.batch_size:
+                pass
+
+    async def flush(self) -> bool:
+        """Пишет одну пачку. False — если запись в БД не удалась (записи остаются в очереди)"""
+        if not self.queue and self.spilled:
+            # Все из памяти записано — дочитываем то, что осталось только в spool
+            self.queue.extend(self._read_spool(self._read_checkpoint(), self.max_queue))
+            self.spilled = len(self.queue) >= self.max_queue
+            if not self.queue:
+                self._compact()
+        if not self.queue:
+            return True
+
+        batch = [self.queue[i] for i in range(min(self.batch_size, len(self.queue)))]
+        events = [
+            (r["task_id"], r["kind"].split(":", 1)[1], datetime.fromisoformat(r["ts"]))
+            for r in batch if r["kind"].startswith(EVENT)
+        ]
+        clicks = [(datetime.fromisoformat(r["ts"]), r["task_id"]) for r in batch if r["kind"] == CLICK]
+
+        started = time.monotonic()
+        try:
+            async with db.unit_of_work():
+                async with db.connection() as conn:
+                    async with conn.cursor() as cur:
+                        if events:
+                            await cur.executemany(
+                                "INSERT INTO task_events (task_id, event_type, event_time) VALUES (%s, %s, %s)",
+                                events
+                            )
+                        if clicks:
+                            await cur.executemany(
+                                "UPDATE task_logs SET clicked_at = %s WHERE id = %s AND clicked_at IS NULL",
+                                clicks
+                            )
+        except Exception as e:
+            self.errors += 1
+            log.error(f"WriteBehindJournal: ошибка записи пачки из {len(batch)}: {e}")
+            return False
+
+        for _ in batch:
+            self.queue.popleft()
+        self.flushed += len(batch)
+        self.batches += 1
+        self.last_flush_at = time.time()
+        self.last_flush_duration = time.monotonic() - started
+        if self.spool_fd is not None:
+            if not self.queue and not self.spilled:
+                self._compact()
+            else:
+                self._write_checkpoint(batch[-1]["seq"])
+        return True
+
+    def stats(self) -> dict:
+        oldest = self.queue[0]["at"] if self.queue else None
+        return {
+            "queued": len(self.queue),
+            "spilled": self.spilled,
+            "lag_seconds": round(time.time() - oldest, 3) if oldest else 0.0,
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "errors": self.errors,
+            "overflows": self.overflows,
+            "last_flush_at": self.last_flush_at,
+            "last_flush_duration": round(self.last_flush_duration, 4) if self.last_flush_duration is not None else None,
+        }
+
+
+journal = WriteBehindJournal(
+    settings.JOURNAL_SPOOL_DIR,
+    settings.JOURNAL_MAX_QUEUE,
+    settings.JOURNAL_BATCH_SIZE,
+    settings.JOURNAL_FLUSH_INTERVAL,
+)
@@ -0,0 +1,25 @@
+from contextlib import asynccontextmanager
+from db.session import db
+
+
+class LockNotAcquired(Exception):
+    """Именованная блокировка MySQL не получена за отведенное время"""
+
+
+@asynccontextmanager
+async def advisory_lock(name: str, timeout: float):
+    """
+    Именованная блокировка MySQL (GET_LOCK) на время блока, общая для всех процессов и хостов.
+    Блокировка привязана к соединению, поэтому соединение удерживается до RELEASE_LOCK.
+    """
+    async with db.pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT GET_LOCK(%s, %s)", (name, timeout))
+            (acquired,) = await cur.fetchone()
+            if acquired != 1:
+                raise LockNotAcquired(name)
+            try:
+                yield conn
+            finally:
+                await cur.execute("SELECT RELEASE_LOCK(%s)", (name,))
+                await cur.fetchone()
@@ -0,0 +1,161 @@
+"""
+Индексы под горячие запросы репозитория и проверка их планов.
+
+    python -m db.migrations            # создать недостающие индексы и проверить планы
+    python -m db.migrations --check    # только проверить планы (EXPLAIN)
+"""
+import argparse
+import asyncio
+import logging
+import aiomysql
+from db import queries
+from db.locks import advisory_lock
+from db.session import db
+
+log = logging.getLogger(__name__)
+
+# (таблица, имя индекса, колонки)
+INDEXES = [
+    # Активные задачи оператора, последняя активная (ORDER BY assigned_at), LEFT JOIN по operator_id + status
+    ("task_logs", "idx_task_logs_operator_status", ("operator_id", "status", "assigned_at")),
+    # Задачи по статусу в порядке назначения (очередь, отслеживание кошельков)
+    ("task_logs", "idx_task_logs_status_assigned", ("status", "assigned_at")),
+    # Последняя задача топика заявки: set_expected_amount, привязка к оператору, очередь
+    ("task_logs", "idx_task_logs_chat_thread", ("chat_id", "message_thread_id", "id")),
+    ("task_events", "idx_task_events_task", ("task_id", "event_time")),
+    ("security_tasks", "idx_security_tasks_deal", ("deal_id", "id")),
+    ("security_tasks", "idx_security_tasks_officer_status", ("officer_id", "status")),
+    ("security_topics", "idx_security_topics_client", ("client_identifier",)),
+    ("employees", "idx_employees_status_role", ("status", "role")),
+    # Дочитывание изменений EmployeeDirectory (get_employees_updated_since)
+    ("employees", "idx_employees_updated_at", ("updated_at",)),
+    ("CryptoDeals", "idx_cryptodeals_chat_topic", ("chat_id", "topic_id")),
+]
+
+# Архивы старых задач (db/retention.py): (рабочая таблица, архивная таблица с той же структурой и индексами)
+ARCHIVE_TABLES = [
+    ("task_logs", "task_logs_archive"),
+    ("task_events", "task_events_archive"),
+]
+
+# Запросы репозитория, планы которых проверяются: (имя, SQL из db.queries, параметры-образцы)
+QUERIES = [
+    ("get_active_tasks_count", queries.ACTIVE_TASKS_COUNT, ("0",)),
+    ("get_last_active_task", queries.LAST_ACTIVE_TASK, ("0",)),
+    ("get_queued_tasks", queries.QUEUED_TASKS, ()),
+    ("get_queued_tasks(task_id)", queries.QUEUED_TASKS + queries.QUEUED_TASK_FILTER, (0,)),
+    ("get_watchable_tasks", queries.WATCHABLE_TASKS, ()),
+    ("assign_task_to_operator", queries.ASSIGN_FROM_QUEUE, ("0", 0)),
+    ("set_expected_amount", queries.SET_EXPECTED_AMOUNT, (0, "0", 0)),
+    ("get_last_operator_assignment", queries.LAST_OPERATOR_ASSIGNMENT, ("0", 0)),
+    ("get_operators_load", queries.OPERATORS_LOAD, ()),
+    ("get_operators_snapshot", queries.OPERATORS_SNAPSHOT, ()),
+    ("get_security_officers_load", queries.SECURITY_OFFICERS_LOAD, ()),
+    ("update_security_task_status", queries.UPDATE_SECURITY_TASK_STATUS, ("x", "0")),
+    ("get_security_topic", queries.SECURITY_TOPIC, ("0",)),
+    ("get_online_managers", queries.ONLINE_MANAGERS, ()),
+    ("get_employees_updated_since", queries.EMPLOYEES_UPDATED_SINCE, ("2000-01-01 00:00:00",)),
+    ("TaskArchiver.archive_batch", queries.ARCHIVE_CANDIDATES, ("2000-01-01 00:00:00", 1000)),
+]
+
+
+async def existing_indexes(cur, table: str) -> set:
+    await cur.execute(
+        "SELECT DISTINCT index_name FROM information_schema.statistics WHERE table_schema = DATABASE() AND table_name = %s",
+        (table,)
+    )
+    return {row[0] for row in await cur.fetchall()}
+
+
+async def existing_columns(cur, table: str) -> set:
+    await cur.execute(
+        "SELECT column_name FROM information_schema.columns WHERE table_schema = DATABASE() AND table_name = %s",
+        (table,)
+    )
+    return {row[0] for row in await cur.fetchall()}
+
+
+async def apply_indexes() -> list:
+    """Создает недостающие индексы (под общей блокировкой, чтобы воркеры не делали это одновременно)"""
+    created = []
+    async with advisory_lock("cryptoops:migrations", 60):
+        async with db.connection() as conn:
+            async with conn.cursor() as cur:
+                for table, name, columns in INDEXES:
+                    if name in await existing_indexes(cur, table):
+                        continue
+                    missing = set(columns) - await existing_columns(cur, table)
+                    if missing:
+                        # Например, employees без updated_at: EmployeeDirectory тогда перечитывает таблицу целиком
+                        log.warning(f"Индекс {name} пропущен: в {table} нет колонок {', '.join(sorted(missing))}")
+                        continue
+                    log.info(f"Создание индекса {name} на {table} ({', '.join(columns)})")
+                    await cur.execute(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})")
+                    created.append(name)
+    return created
+
+
+async def create_archive_tables() -> list:
+    """Создает недостающие архивные таблицы по образцу рабочих (после apply_indexes — индексы копируются тоже)"""
+    created = []
+    async with db.connection() as conn:
+        async with conn.cursor() as cur:
+            for table, archive in ARCHIVE_TABLES:
+                await cur.execute("SHOW TABLES LIKE %s", (archive,))
+                if await cur.fetchone():
+                    continue
+                log.info(f"Создание архивной таблицы {archive} по образцу {table}")
+                await cur.execute(f"CREATE TABLE IF NOT EXISTS {archive} LIKE {table}")
+                created.append(archive)
+    return created
+
+
+async def check_query_plans() -> list:
+    """
+    EXPLAIN для каждого запроса из QUERIES. Возвращает проблемы: полный просмотр таблицы (type = ALL)
+    или filesort без индекса. Таблицы сотрудников малы, но тоже отмечаются — решение за читателем отчета.
+    """
+    problems = []
+    async with db.connection() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cur:
+            for name, sql, params in QUERIES:
+                try:
+                    await cur.execute("EXPLAIN " + sql, params)
+                except aiomysql.Error as e:
+                    # Нет таблицы или колонки (например, employees.updated_at) — отмечаем, проверяем остальные
+                    problems.append({"query": name, "table": None, "issue": f"ошибка: {e}", "rows": None})
+                    continue
+                for row in await cur.fetchall():
+                    extra = row.get("Extra") or ""
+                    if row.get("type") == "ALL":
+                        problems.append({"query": name, "table": row.get("table"), "issue": "full scan", "rows": row.get("rows")})
+                    elif "Using filesort" in extra and not row.get("key"):
+                        problems.append({"query": name, "table": row.get("table"), "issue": "filesort", "rows": row.get("rows")})
+    for problem in problems:
+        log.warning(f"План запроса {problem['query']}: {problem['issue']} по {problem['table']} (~{problem['rows']} строк)")
+    return problems
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check", action="store_true", help="только проверить планы, индексы не создавать")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    await db.connect()
+    try:
+        if not args.check:
+            created = await apply_indexes()
+            print(f"Создано индексов: {len(created)}" + (f" ({', '.join(created)})" if created else ""))
+            archives = await create_archive_tables()
+            print(f"Создано архивных таблиц: {len(archives)}" + (f" ({', '.join(archives)})" if archives else ""))
+        problems = await check_query_plans()
+        print(f"Проблемных планов: {len(problems)}")
+        for problem in problems:
+            print(f"  {problem['query']}: {problem['issue']} по {problem['table']} (~{problem['rows']} строк)")
+    finally:
+        await db.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
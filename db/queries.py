@@ -0,0 +1,116 @@
+"""
+SQL горячих запросов. Общие для репозитория (db/repository.py, db/retention.py) и проверки планов
+(db/migrations.py), чтобы проверялся ровно тот текст, который выполняется.
+"""
+
+# --- task_logs ---
+
+ASSIGN_FROM_QUEUE = (
+    "UPDATE task_logs SET operator_id = %s WHERE id = %s AND operator_id = 'queue' AND status = 'pending'"
+)
+
+# Доставка оператору не удалась — задача возвращается в общую очередь, топик без кнопки "Принять" забывается
+RETURN_TO_QUEUE = (
+    "UPDATE task_logs SET operator_id = 'queue', operator_thread_id = NULL "
+    "WHERE id = %s AND operator_id = %s AND status = 'pending'"
+)
+
+ACTIVE_TASKS_COUNT = "SELECT COUNT(*) FROM task_logs WHERE operator_id = %s AND status = 'active'"
+
+LAST_ACTIVE_TASK = """
+    SELECT * FROM task_logs 
+    WHERE operator_id = %s AND status = 'active' 
+    ORDER BY assigned_at DESC LIMIT 1
+"""
+
+SET_EXPECTED_AMOUNT = (
+    "UPDATE task_logs SET expected_amount = %s WHERE chat_id = %s AND message_thread_id = %s ORDER BY id DESC LIMIT 1"
+)
+
+# Задачи общей очереди со временем визита по сделке; QUEUED_TASK_FILTER — только одна задача
+QUEUED_TASKS = """
+    SELECT t.id, t.chat_id, t.message_thread_id, t.assigned_at, d.datetime_meeting
+    FROM task_logs t
+    LEFT JOIN CryptoDeals d
+           ON d.chat_id = t.chat_id AND d.topic_id = t.message_thread_id
+    WHERE t.operator_id = 'queue' AND t.status = 'pending'
+"""
+QUEUED_TASK_FILTER = " AND t.id = %s"
+
+LAST_OPERATOR_ASSIGNMENT = """
+    SELECT operator_id, operator_thread_id FROM task_logs
+    WHERE chat_id = %s AND message_thread_id = %s
+      AND operator_id <> 'queue' AND operator_thread_id IS NOT NULL
+    ORDER BY id DESC LIMIT 1
+"""
+
+WATCHABLE_TASKS = """
+    SELECT t.id, t.operator_id, t.operator_thread_id, t.wallet_address, t.expected_amount, t.assigned_at,
+           d.currency_to_get, d.currency_to_give
+    FROM task_logs t
+    LEFT JOIN CryptoDeals d
+           ON d.chat_id = t.chat_id AND d.topic_id = t.message_thread_id
+    WHERE t.status IN ('active', 'paused')
+      AND t.expected_amount IS NOT NULL
+      AND t.wallet_address IS NOT NULL AND t.wallet_address != ''
+"""
+
+# Пачка завершенных задач старше срока для переноса в архив (TaskArchiver)
+ARCHIVE_CANDIDATES = (
+    "SELECT id FROM task_logs WHERE status = 'completed' AND assigned_at < %s "
+    "ORDER BY assigned_at LIMIT %s FOR UPDATE"
+)
+
+# --- Операторы и СБ ---
+
+OPERATORS_LOAD = """
+    SELECT e.personal_telegram_id, e.personal_telegram_username,
+           COALESCE(SUM(t.status = 'active'), 0) AS active_count,
+           COALESCE(SUM(t.status = 'paused'), 0) AS paused_count,
+           COALESCE(SUM(t.status = 'pending'), 0) AS pending_count
+    FROM employees e
+    LEFT JOIN task_logs t
+           ON t.operator_id = CAST(e.personal_telegram_id AS CHAR)
+          AND t.status IN ('pending', 'active', 'paused')
+    WHERE e.status = 'online' AND e.role = 'Operator'
+    GROUP BY e.personal_telegram_id, e.personal_telegram_username
+"""
+
+OPERATORS_SNAPSHOT = """
+    SELECT e.personal_telegram_id, e.personal_telegram_username, e.status,
+           t.id AS task_id, t.status AS task_status, t.assigned_at, t.operator_thread_id
+    FROM employees e
+    LEFT JOIN task_logs t
+           ON t.operator_id = CAST(e.personal_telegram_id AS CHAR)
+          AND t.status IN ('pending', 'active', 'paused')
+    WHERE e.role = 'Operator'
+"""
+
+SECURITY_OFFICERS_LOAD = """
+    SELECT e.id, e.personal_telegram_id, e.personal_telegram_username,
+           COUNT(s.id) AS active_count
+    FROM employees e
+    LEFT JOIN security_tasks s
+           ON s.officer_id = e.id AND s.status = 'active'
+    WHERE e.status = 'online' AND e.role = 'Security'
+    GROUP BY e.id, e.personal_telegram_id, e.personal_telegram_username
+    ORDER BY e.id ASC
+"""
+
+SECURITY_TOPIC = "SELECT topic_id FROM security_topics WHERE client_identifier = %s"
+
+# Обновляем самую последнюю задачу СБ для данной сделки
+UPDATE_SECURITY_TASK_STATUS = """
+    UPDATE security_tasks SET status = %s
+    WHERE deal_id = %s ORDER BY id DESC LIMIT 1
+"""
+
+# --- Сотрудники ---
+
+ONLINE_MANAGERS = """
+    SELECT id, personal_telegram_id, personal_telegram_username
+    FROM employees
+    WHERE status = 'online' AND role = 'Manager'
+"""
+
+EMPLOYEES_UPDATED_SINCE = "SELECT * FROM employees WHERE updated_at >= %s"
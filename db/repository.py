@@ -1,31 +1,61 @@
 import aiomysql
 import uuid
+from core.cache import TTLCache
+from core.config import settings
+from db import queries
+from db.journal import journal
 from db.session import db
 from datetime import datetime
 
-async def assign_task_to_operator(task_id, operator_id):
-    async with db.pool.acquire() as conn:
+# URL формы задачи не меняется — кэшируем для /click
+form_url_cache = TTLCache(maxsize=10000, ttl=86400.0)
+# Строки CryptoDeals для обработчиков кнопок; любая запись в CryptoDeals должна сбрасывать запись кэша.
+# TTL — страховка от изменений в обход приложения
+deal_cache = TTLCache(maxsize=settings.DEAL_CACHE_MAXSIZE, ttl=settings.DEAL_CACHE_TTL)
+
+# Запись — db.connection(write=True). db.connection(replica=True) — только для чтений, где результат,
+# отстающий на секунды, безвреден. Данные, по которым выбирается исполнитель или меняется статус
+# (загрузка операторов и СБ, статус задачи), читаются только с primary. Реплика допустима для подсказок
+# назначению, итог которых решает primary: условная запись (get_queued_tasks) или выбор под блокировкой
+# по загрузке с primary (get_last_operator_assignment). Почему это безопасно — в докстринге такой функции
+
+async def assign_task_to_operator(task_id, operator_id) -> bool:
+    """Забирает задачу из общей очереди. False — если ее уже назначили"""
+    async with db.connection(write=True) as conn:
         async with conn.cursor() as cur:
-            await cur.execute(
-                "UPDATE task_logs SET operator_id = %s WHERE id = %s",
-                (str(operator_id), task_id)
-            )
+            await cur.execute(queries.ASSIGN_FROM_QUEUE, (str(operator_id), task_id))
+            return cur.rowcount > 0
 
-async def get_online_operators():
-    """Возвращает список онлайн операторов в виде списка словарей"""
-    async with db.pool.acquire() as conn:
+async def return_task_to_queue(task_id, operator_id) -> bool:
+    """Возвращает назначенную, но не принятую задачу в общую очередь. False — если ее уже приняли или закрыли"""
+    async with db.connection(write=True) as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(queries.RETURN_TO_QUEUE, (task_id, str(operator_id)))
+            return cur.rowcount > 0
+
+async def get_operators_load():
+    """
+    Одним запросом: онлайн операторы с количеством активных, назначенных (еще не принятых)
+    задач и задач на паузе. Выбор по емкости делает TaskBalancer.
+    """
+    async with db.connection() as conn:
         async with conn.cursor(aiomysql.DictCursor) as cur:
-            query = """
-                SELECT personal_telegram_id, personal_telegram_username 
-                FROM employees 
-                WHERE status = 'online' AND role = 'Operator'
-            """
-            await cur.execute(query)
+            await cur.execute(queries.OPERATORS_LOAD)
+            return await cur.fetchall()
+
+async def get_operators_snapshot():
+    """
+    Снимок для OperatorRegistry: все операторы с онлайн-статусом и их задачи в работе.
+    Одна строка на задачу (pending/active/paused); оператор без задач — одна строка с task_id = NULL.
+    """
+    async with db.connection() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cur:
+            await cur.execute(queries.OPERATORS_SNAPSHOT)
             return await cur.fetchall()
 
 async def create_task_log(operator_id, chat_id, thread_id, form_url, assigned_at):
     """Создает запись о назначении задачи и возвращает её ID"""
-    async with db.pool.acquire() as conn:
+    async with db.connection(write=True) as conn:
         async with conn.cursor() as cur:
             query = """
                 INSERT INTO task_logs (operator_id, chat_id, message_thread_id, form_url, assigned_at)
@@ -35,113 +65,93 @@ async def create_task_log(operator_id, chat_id, thread_id, form_url, assigned_at
             return cur.lastrowid
 
 async def log_task_click(task_id, clicked_at):
-    """Фиксирует время нажатия и возвращает URL формы для редиректа"""
-    async with db.pool.acquire() as conn:
-        async with conn.cursor(aiomysql.DictCursor) as cur:
-            # Сначала получаем URL
-            await cur.execute("SELECT form_url FROM task_logs WHERE id = %s", (task_id,))
-            result = await cur.fetchone()
-            if result:
-                # Обновляем время нажатия
-                await cur.execute(
-                    "UPDATE task_logs SET clicked_at = %s WHERE id = %s AND clicked_at IS NULL",
-                    (clicked_at, task_id)
-                )
-                return result['form_url']
+    """Фиксирует время нажатия (отложенной записью) и возвращает URL формы для редиректа"""
+    form_url = form_url_cache.get(task_id)
+    if form_url is None:
+        async with db.connection() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cur:
+                await cur.execute("SELECT form_url FROM task_logs WHERE id = %s", (task_id,))
+                result = await cur.fetchone()
+        if not result:
             return None
-        
+        form_url = result['form_url']
+        form_url_cache.set(task_id, form_url)
+    journal.record_click(task_id, clicked_at)
+    return form_url
+
 async def get_active_tasks_count(operator_id):
     """Считает количество задач в статусе 'active' для конкретного оператора"""
-    async with db.pool.acquire() as conn:
+    async with db.connection() as conn:
         async with conn.cursor() as cur:
-            await cur.execute(
-                "SELECT COUNT(*) FROM task_logs WHERE operator_id = %s AND status = 'active'", 
-                (str(operator_id),)
-            )
+            await cur.execute(queries.ACTIVE_TASKS_COUNT, (str(operator_id),))
             res = await cur.fetchone()
             # Возвращаем первый элемент кортежа (результат COUNT)
             return res[0] if res else 0
 
-async def update_task_status(task_id, status, blockchain_url=None):
-    async with db.pool.acquire() as conn:
+async def update_task_status(task_id, status, blockchain_url=None, from_statuses=None) -> bool:
+    """from_statuses — менять, только если текущий статус один из них. False — если строка не изменилась"""
+    async with db.connection(write=True) as conn:
         async with conn.cursor() as cur:
+            query, params = "UPDATE task_logs SET status=%s", [status]
             if blockchain_url:
-                await cur.execute("UPDATE task_logs SET status=%s, blockchain_url=%s WHERE id=%s", (status, blockchain_url, task_id))
-            else:
-                await cur.execute("UPDATE task_logs SET status=%s WHERE id=%s", (status, task_id))
+                query += ", blockchain_url=%s"
+                params.append(blockchain_url)
+            query += " WHERE id=%s"
+            params.append(task_id)
+            if from_statuses:
+                query += " AND status IN %s"
+                params.append(tuple(from_statuses))
+            await cur.execute(query, params)
+            return cur.rowcount > 0
+
+async def set_task_status(task_id, status, event_type: str, from_statuses=None) -> bool:
+    """
+    Меняет статус задачи; событие уходит в историю отложенной записью (только если статус изменился).
+    Внутри unit_of_work событие записывается после COMMIT: откаченная смена статуса в историю не попадает
+    """
+    if not await update_task_status(task_id, status, from_statuses=from_statuses) and from_statuses:
+        return False
+    db.after_commit(lambda: journal.record_event(task_id, event_type))
+    return True
 
 async def set_expected_amount(chat_id, thread_id, amount):
     """Сохраняет сумму из расчета в последнюю активную задачу этого топика"""
-    async with db.pool.acquire() as conn:
+    async with db.connection(write=True) as conn:
         async with conn.cursor() as cur:
-            await cur.execute(
-                "UPDATE task_logs SET expected_amount = %s WHERE chat_id = %s AND message_thread_id = %s ORDER BY id DESC LIMIT 1",
-                (amount, str(chat_id), thread_id)
-            )
+            await cur.execute(queries.SET_EXPECTED_AMOUNT, (amount, str(chat_id), thread_id))
 
 async def get_task_by_id(task_id):
-    async with db.pool.acquire() as conn:
+    async with db.connection() as conn:
         async with conn.cursor(aiomysql.DictCursor) as cur:
             await cur.execute("SELECT * FROM task_logs WHERE id = %s", (task_id,))
             return await cur.fetchone()
 
-async def get_online_security_officers():
-    """Возвращает список онлайн сотрудников СБ."""
-    async with db.pool.acquire() as conn:
+async def get_security_officers_load():
+    """Одним запросом: онлайн сотрудники СБ с количеством активных задач."""
+    async with db.connection() as conn:
         async with conn.cursor(aiomysql.DictCursor) as cur:
-            query = """
-                SELECT id, personal_telegram_id, personal_telegram_username 
-                FROM employees 
-                WHERE status = 'online' AND role = 'Security'
-            """
-            await cur.execute(query)
+            await cur.execute(queries.SECURITY_OFFICERS_LOAD)
             return await cur.fetchall()
 
-async def get_active_security_tasks_count(officer_id: int):
-    """Считает активные задачи для сотрудника СБ."""
-    async with db.pool.acquire() as conn:
-        async with conn.cursor() as cur:
-            await cur.execute(
-                "SELECT COUNT(*) FROM security_tasks WHERE officer_id = %s AND status = 'active'", 
-                (officer_id,)
-            )
-            res = await cur.fetchone()
-            return res[0] if res else 0
-
-async def find_or_create_security_topic(client_identifier, security_group_id: int, officer_id: int, task_type: str) -> int:
-    """Ищет тему для клиента в чате СБ, создает новую или переименовывает существующую."""
-    async with db.pool.acquire() as conn:
+async def get_security_topic(client_identifier):
+    """Тема клиента в чате СБ или None"""
+    async with db.connection() as conn:
         async with conn.cursor(aiomysql.DictCursor) as cur:
-            from services.bot_service import bot
-            topic_title = f"{task_type} | Клиент: {client_identifier}"
-
-            # Ищем существующую тему по идентификатору клиента
-            await cur.execute("SELECT topic_id FROM security_topics WHERE client_identifier = %s", (str(client_identifier),))
-            existing = await cur.fetchone()
-
-            if existing:
-                topic_id = existing['topic_id']
-                try:
-                    # Переименовываем существующую тему
-                    await bot.edit_forum_topic(chat_id=security_group_id, message_thread_id=topic_id, name=topic_title)
-                except Exception as e:
-                    # Логируем ошибку, если не удалось переименовать, но продолжаем работу
-                    print(f"Could not rename topic {topic_id}: {e}")
-                return topic_id
-            
-            # Если не нашли, создаем новую
-            topic = await bot.create_forum_topic(chat_id=security_group_id, name=topic_title)
-            
-            # Сохраняем в БД
+            await cur.execute(queries.SECURITY_TOPIC, (str(client_identifier),))
+            return await cur.fetchone()
+
+async def save_security_topic(client_identifier, security_group_id: int, officer_id: int, topic_id: int):
+    """Сохраняет созданную тему клиента в чате СБ"""
+    async with db.connection(write=True) as conn:
+        async with conn.cursor() as cur:
             await cur.execute(
                 "INSERT INTO security_topics (client_identifier, security_chat_id, officer_id, topic_id) VALUES (%s, %s, %s, %s)",
-                (str(client_identifier), security_group_id, officer_id, topic.message_thread_id)
+                (str(client_identifier), security_group_id, officer_id, topic_id)
             )
-            return topic.message_thread_id
 
 async def create_security_task(original_task_id: str, officer_id: int, topic_id: int, is_deal_task: bool = False) -> int:
     """Создает задачу в таблице security_tasks."""
-    async with db.pool.acquire() as conn:
+    async with db.connection(write=True) as conn:
         async with conn.cursor() as cur:
             # В зависимости от флага, пишем ID в deal_id или в operator_task_id
             task_id_field = "deal_id" if is_deal_task else "operator_task_id"
@@ -150,15 +160,22 @@ async def create_security_task(original_task_id: str, officer_id: int, topic_id:
             return cur.lastrowid
 
 async def get_deal_by_id(deal_id: str):
-    """Получает информацию о сделке из таблицы CryptoDeals по ее ID."""
-    async with db.pool.acquire() as conn:
-        async with conn.cursor(aiomysql.DictCursor) as cur:
-            await cur.execute("SELECT * FROM CryptoDeals WHERE deals_id = %s", (deal_id,))
-            return await cur.fetchone()
+    """Получает информацию о сделке из таблицы CryptoDeals по ее ID (через кэш)."""
+    deal = deal_cache.get(deal_id)
+    if deal is None:
+        async with db.connection() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cur:
+                await cur.execute("SELECT * FROM CryptoDeals WHERE deals_id = %s", (deal_id,))
+                deal = await cur.fetchone()
+        if deal is None:
+            return None
+        deal_cache.set(deal_id, deal)
+    # Копия, чтобы изменения у вызывающего не попали в кэш
+    return dict(deal)
 
 async def create_deal_from_topic(data, chat_id, topic_id) -> str | None:
     """Создает запись в CryptoDeals и возвращает ее ID."""
-    async with db.pool.acquire() as conn:
+    async with db.connection(write=True) as conn:
         async with conn.cursor() as cur:
             deals_id = str(uuid.uuid4())
 
@@ -197,82 +214,127 @@ async def create_deal_from_topic(data, chat_id, topic_id) -> str | None:
                 data.form_url
             )
             await cur.execute(query, params)
+
+        # Кладем в кэш строку целиком (со значениями по умолчанию из БД) — кнопки сделки читают ее сразу
+        async with conn.cursor(aiomysql.DictCursor) as cur:
+            await cur.execute("SELECT * FROM CryptoDeals WHERE deals_id = %s", (deals_id,))
+            deal = await cur.fetchone()
+            if deal:
+                deal_cache.set(deals_id, deal)
             return deals_id
 
 async def update_deal_creator_topic(deal_id: str, creator_topic_id: int):
     """Обновляет ID топика создателя в CryptoDeals."""
-    async with db.pool.acquire() as conn:
+    async with db.connection(write=True) as conn:
         async with conn.cursor() as cur:
             query = "UPDATE CryptoDeals SET creator_topic_id = %s WHERE deals_id = %s"
             await cur.execute(query, (creator_topic_id, deal_id))
+    deal_cache.pop(deal_id)
 
 async def get_last_active_task(operator_id):
     """Находит последнюю активную задачу конкретного оператора"""
-    async with db.pool.acquire() as conn:
+    async with db.connection() as conn:
         async with conn.cursor(aiomysql.DictCursor) as cur:
-            query = """
-                SELECT * FROM task_logs 
-                WHERE operator_id = %s AND status = 'active' 
-                ORDER BY assigned_at DESC LIMIT 1
-            """
-            await cur.execute(query, (str(operator_id),))
+            await cur.execute(queries.LAST_ACTIVE_TASK, (str(operator_id),))
             return await cur.fetchone()
 
-async def get_oldest_pending_task():
-    """Находит самую старую задачу в очереди (статус pending)"""
-    async with db.pool.acquire() as conn:
+async def get_queued_tasks(task_id=None):
+    """
+    Задачи в общей очереди (operator_id = 'queue', статус pending) вместе со временем визита
+    по сделке из того же топика. С task_id — только эта задача.
+    Реплика допустима: уже назначенная задача из отстающей реплики не уйдет второму оператору —
+    ASSIGN_FROM_QUEUE забирает ее условным UPDATE на primary. enqueue после create_task_log читает
+    с primary (запись в этом же запросе, DB_REPLICA_STICKY_SECONDS); пропущенное догонит пересинхронизация.
+    """
+    async with db.connection(replica=True) as conn:
         async with conn.cursor(aiomysql.DictCursor) as cur:
-            query = "SELECT * FROM task_logs WHERE status = 'pending' ORDER BY assigned_at ASC LIMIT 1"
-            await cur.execute(query)
-            return await cur.fetchone()
+            query = queries.QUEUED_TASKS
+            params = ()
+            if task_id is not None:
+                query += queries.QUEUED_TASK_FILTER
+                params = (task_id,)
+            await cur.execute(query, params)
+            return await cur.fetchall()
 
 async def update_operator_thread(task_id, thread_id):
     """Сохраняет ID созданного топика оператора"""
-    async with db.pool.acquire() as conn:
+    async with db.connection(write=True) as conn:
         async with conn.cursor() as cur:
             await cur.execute(
                 "UPDATE task_logs SET operator_thread_id = %s WHERE id = %s",
                 (thread_id, task_id)
             )
 
-async def log_task_event(task_id: int, event_type: str):
-    """Записывает событие (пауза, продолжение и т.д.) в историю"""
-    async with db.pool.acquire() as conn:
-        async with conn.cursor() as cur:
-            query = """
-                INSERT INTO task_events (task_id, event_type, event_time)
-                VALUES (%s, %s, %s)
-            """
-            await cur.execute(query, (task_id, event_type, datetime.now()))
-
+async def get_last_operator_assignment(chat_id, thread_id):
+    """
+    Последнее назначение задачи из топика заявки оператору, у которого уже есть топик.
+    Реплика допустима: это лишь предпочтение (TopicAffinity), оператора все равно выбирает
+    TaskBalancer по загрузке с primary под блокировкой. При отставании реплики задача уйдет
+    прежнему оператору или в новый топик, а TopicAffinity.remember перезапишет привязку при доставке.
+    """
+    async with db.connection(replica=True) as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cur:
+            await cur.execute(queries.LAST_OPERATOR_ASSIGNMENT, (chat_id, thread_id))
+            return await cur.fetchone()
 
 async def get_employee_by_id(employee_id: int):
     """Возвращает данные сотрудника по его ID из таблицы employees."""
-    async with db.pool.acquire() as conn:
+    async with db.connection() as conn:
         async with conn.cursor(aiomysql.DictCursor) as cur:
             query = "SELECT * FROM employees WHERE id = %s"
             await cur.execute(query, (employee_id,))
             return await cur.fetchone()
 
+async def get_all_employees():
+    """Все сотрудники — для загрузки EmployeeDirectory"""
+    async with db.connection() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cur:
+            await cur.execute("SELECT * FROM employees")
+            return await cur.fetchall()
+
+async def get_employees_updated_since(updated_at):
+    """Сотрудники, измененные не раньше updated_at (нестрогое сравнение: строки с той же меткой перечитываются)"""
+    async with db.connection() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cur:
+            await cur.execute(queries.EMPLOYEES_UPDATED_SINCE, (updated_at,))
+            return await cur.fetchall()
+
 async def get_online_managers():
     """Возвращает список онлайн сотрудников с ролью 'Manager'."""
-    async with db.pool.acquire() as conn:
+    async with db.connection(replica=True) as conn:
         async with conn.cursor(aiomysql.DictCursor) as cur:
-            query = """
-                SELECT id, personal_telegram_id, personal_telegram_username
-                FROM employees
-                WHERE status = 'online' AND role = 'Manager'
-            """
-            await cur.execute(query)
+            await cur.execute(queries.ONLINE_MANAGERS)
             return await cur.fetchall()
 
 async def update_security_task_status(deal_id: str, status: str):
     """Обновляет статус задачи СБ, связанной с deal_id."""
-    async with db.pool.acquire() as conn:
+    async with db.connection(write=True) as conn:
         async with conn.cursor() as cur:
-            # Обновляем самую последнюю задачу СБ для данной сделки
-            query = """
-                UPDATE security_tasks SET status = %s
-                WHERE deal_id = %s ORDER BY id DESC LIMIT 1
-            """
-            await cur.execute(query, (status, deal_id))
\ No newline at end of file
+            await cur.execute(queries.UPDATE_SECURITY_TASK_STATUS, (status, deal_id))
+
+async def get_watchable_tasks():
+    """
+    Задачи в работе, по которым известны кошелек и ожидаемая сумма (для WalletWatcher),
+    с валютами сделки из того же топика
+    """
+    async with db.connection() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cur:
+            await cur.execute(queries.WATCHABLE_TASKS)
+            return await cur.fetchall()
+
+async def get_task_history(task_id: int):
+    """Задача и ее события с учетом архива (db/retention.py): (строка задачи или None, события по времени)"""
+    async with db.connection() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cur:
+            await cur.execute(
+                "SELECT * FROM task_logs WHERE id = %s UNION ALL SELECT * FROM task_logs_archive WHERE id = %s LIMIT 1",
+                (task_id, task_id)
+            )
+            task = await cur.fetchone()
+            await cur.execute(
+                "SELECT task_id, event_type, event_time FROM task_events WHERE task_id = %s "
+                "UNION ALL SELECT task_id, event_type, event_time FROM task_events_archive WHERE task_id = %s "
+                "ORDER BY event_time",
+                (task_id, task_id)
+            )
+            return task, await cur.fetchall()
\ No newline at end of file
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from core.config import settings
+from db import queries
+from db.migrations import create_archive_tables
+from db.session import db
+
+log = logging.getLogger(__name__)
+
+class TaskArchiver:
+    """
+    Перенос завершенных задач старше RETENTION_DAYS (по assigned_at) и их событий в task_logs_archive /
+    task_events_archive, чтобы рабочие таблицы, по которым ходят балансировщики и очередь, оставались малы.
+    Переносит пачками по batch_size задач, каждая пачка — одна транзакция (копия в архив + удаление),
+    между пачками пауза, чтобы не мешать рабочей нагрузке. Запускается только у лидера.
+    Архивные таблицы создаются при первом запуске, если их еще нет (db.migrations.create_archive_tables).
+    """
+
+    def __init__(self, days: int, batch_size: int, interval: float, batch_pause: float):
+        self.days = days
+        self.batch_size = batch_size
+        self.interval = interval
+        self.batch_pause = batch_pause
+        self.tables_ready = False
+        self.task = None
+        # Метрики
+        self.archived_tasks = 0
+        self.archived_events = 0
+        self.runs = 0
+        self.errors = 0
+        self.last_run_at = None
+        self.last_run_duration = None
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+            log.info("TaskArchiver started")
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                log.error(f"TaskArchiver error: {e}", exc_info=True)
+            await asyncio.sleep(self.interval)
+
+    async def ensure_tables(self):
+        if self.tables_ready:
+            return
+        await create_archive_tables()
+        self.tables_ready = True
+
+    async def run(self) -> int:
+        """Один проход: переносит пачки, пока находятся задачи старше срока. Возвращает число задач"""
+        await self.ensure_tables()
+        started = time.monotonic()
+        cutoff = datetime.now() - timedelta(days=self.days)
+        total = 0
+        while True:
+            moved = await self.archive_batch(cutoff)
+            total += moved
+            if moved < self.batch_size:
+                break
+            await asyncio.sleep(self.batch_pause)
+        self.runs += 1
+        self.last_run_at = time.time()
+        self.last_run_duration = time.monotonic() - started
+        if total:
+            log.info(f"TaskArchiver: в архив перенесено задач: {total} (до {cutoff:%Y-%m-%d %H:%M})")
+        return total
+
+    async def archive_batch(self, cutoff: datetime) -> int:
+        async with db.unit_of_work():
+            async with db.connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(queries.ARCHIVE_CANDIDATES, (cutoff, self.batch_size))
+                    ids = tuple(row[0] for row in await cur.fetchall())
+            if not ids:
+                return 0
+            # Копии — INSERT IGNORE: пачка, прерванная после копирования, повторяется без ошибок
+            _, events, _, _ = await db.execute_batch([
+                ("INSERT IGNORE INTO task_events_archive SELECT * FROM task_events WHERE task_id IN %s", (ids,)),
+                ("DELETE FROM task_events WHERE task_id IN %s", (ids,)),
+                ("INSERT IGNORE INTO task_logs_archive SELECT * FROM task_logs WHERE id IN %s", (ids,)),
+                ("DELETE FROM task_logs WHERE id IN %s", (ids,)),
+            ])
+        self.archived_tasks += len(ids)
+        self.archived_events += events
+        return len(ids)
+
+    def stats(self) -> dict:
+        return {
+            "days": self.days,
+            "archived_tasks": self.archived_tasks,
+            "archived_events": self.archived_events,
+            "runs": self.runs,
+            "errors": self.errors,
+            "last_run_at": self.last_run_at,
+            "last_run_duration": round(self.last_run_duration, 3) if self.last_run_duration is not None else None,
+        }
+
+
+archiver = TaskArchiver(
+    settings.RETENTION_DAYS,
+    settings.RETENTION_BATCH_SIZE,
+    settings.RETENTION_INTERVAL,
+    settings.RETENTION_BATCH_PAUSE,
+)
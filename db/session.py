@@ -1,9 +1,42 @@
 import aiomysql
+import asyncio
+import contextvars
+import itertools
+import logging
+from contextlib import asynccontextmanager
 from core.config import settings
 
+log = logging.getLogger(__name__)
+
+# Соединение текущей единицы работы (unit_of_work); None — вне единицы работы
+current_connection = contextvars.ContextVar("current_connection", default=None)
+# Время (loop.time()) последней записи в текущем запросе: после нее чтения идут на primary
+last_write_at = contextvars.ContextVar("last_write_at", default=None)
+# Колбэки, ждущие COMMIT транзакции текущей единицы работы; None — вне транзакции
+after_commit_callbacks = contextvars.ContextVar("after_commit_callbacks", default=None)
+
+
+def parse_replica_hosts(value: str) -> list:
+    """'host1:3307,host2' -> [('host1', 3307), ('host2', DB_PORT)]"""
+    hosts = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, port = item.partition(":")
+        hosts.append((host, int(port) if port else settings.DB_PORT))
+    return hosts
+
+
 class Database:
     def __init__(self):
         self.pool = None
+        self.replicas = []
+        self.replica_cycle = None
+        # Метрики маршрутизации чтений
+        self.replica_reads = 0
+        self.sticky_reads = 0
+        self.replica_errors = 0
 
     async def connect(self):
         if not self.pool:
@@ -15,12 +48,169 @@ class Database:
                 db=settings.DB_NAME,
                 minsize=5,
                 maxsize=20,
-                autocommit=True  
+                autocommit=True
             )
+        if not self.replicas:
+            for host, port in parse_replica_hosts(settings.DB_REPLICA_HOSTS):
+                try:
+                    self.replicas.append(await aiomysql.create_pool(
+                        host=host,
+                        port=port,
+                        user=settings.DB_USER,
+                        password=settings.DB_PASSWORD,
+                        db=settings.DB_NAME,
+                        minsize=settings.DB_REPLICA_POOL_MINSIZE,
+                        maxsize=settings.DB_REPLICA_POOL_MAXSIZE,
+                        autocommit=True
+                    ))
+                except Exception as e:
+                    # Без реплики приложение работает: чтения остаются на primary
+                    log.error(f"Реплика {host}:{port} недоступна: {e}")
+            self.replica_cycle = itertools.cycle(self.replicas) if self.replicas else None
+
+    async def connect_single(self):
+        """Отдельное соединение вне пула — для блокировок, которые держатся долго (выбор лидера)"""
+        return await aiomysql.connect(
+            host=settings.DB_HOST,
+            port=settings.DB_PORT,
+            user=settings.DB_USER,
+            password=settings.DB_PASSWORD,
+            db=settings.DB_NAME,
+            autocommit=True
+        )
+
+    def mark_write(self):
+        """Запрос что-то записал — его следующие чтения (DB_REPLICA_STICKY_SECONDS) идут на primary"""
+        last_write_at.set(asyncio.get_running_loop().time())
+
+    def _read_pool(self):
+        """Пул реплики для чтения или None, если реплик нет или запрос недавно писал"""
+        if self.replica_cycle is None:
+            return None
+        written = last_write_at.get()
+        if written is not None and asyncio.get_running_loop().time() - written < settings.DB_REPLICA_STICKY_SECONDS:
+            self.sticky_reads += 1
+            return None
+        return next(self.replica_cycle)
+
+    @asynccontextmanager
+    async def connection(self, replica: bool = False, write: bool = False):
+        """
+        Соединение текущей единицы работы, а вне ее — свое соединение из пула на время блока.
+        replica=True — чтение, которое допускает отставание реплики: идет на реплику, если она настроена
+        и запрос ничего не писал последние DB_REPLICA_STICKY_SECONDS. write=True — блок пишет
+        (включает чтение своих записей с primary). Внутри единицы работы всегда используется ее соединение.
+        """
+        if write:
+            self.mark_write()
+        conn = current_connection.get()
+        if conn is not None:
+            yield conn
+            return
+        pool = self._read_pool() if replica else None
+        if pool is not None:
+            try:
+                conn = await pool.acquire()
+            except Exception as e:
+                self.replica_errors += 1
+                log.warning(f"Реплика недоступна, чтение с primary: {e}")
+                pool = None
+            else:
+                self.replica_reads += 1
+        if pool is None:
+            pool = self.pool
+            conn = await pool.acquire()
+        try:
+            yield conn
+        finally:
+            await pool.release(conn)
+
+    @asynccontextmanager
+    async def unit_of_work(self, transaction: bool = True):
+        """
+        Одно соединение на весь блок: функции репозитория внутри него используют его же.
+        transaction=True — блок выполняется одной транзакцией (COMMIT в конце, ROLLBACK при исключении).
+        Вложенный unit_of_work присоединяется к внешнему. Задачи, запущенные внутри блока,
+        наследуют соединение, поэтому параллельную работу из него запускать через detached().
+        """
+        if transaction:
+            self.mark_write()
+        if current_connection.get() is not None:
+            yield current_connection.get()
+            return
+        async with self.pool.acquire() as conn:
+            token = current_connection.set(conn)
+            callbacks = []
+            callbacks_token = after_commit_callbacks.set(callbacks if transaction else None)
+            try:
+                if transaction:
+                    await conn.begin()
+                yield conn
+                if transaction:
+                    await conn.commit()
+            except BaseException:
+                if transaction:
+                    await conn.rollback()
+                raise
+            finally:
+                after_commit_callbacks.reset(callbacks_token)
+                current_connection.reset(token)
+        for callback in callbacks:
+            callback()
+
+    def after_commit(self, callback):
+        """
+        Вызывает callback после COMMIT транзакции текущей единицы работы (при ROLLBACK — не вызывает).
+        Вне транзакции запись уже зафиксирована — callback вызывается сразу.
+        """
+        callbacks = after_commit_callbacks.get()
+        if callbacks is None:
+            callback()
+        else:
+            callbacks.append(callback)
+
+    @asynccontextmanager
+    async def detached(self):
+        """Блок вне текущей единицы работы: репозиторий снова берет соединения из пула"""
+        token = current_connection.set(None)
+        callbacks_token = after_commit_callbacks.set(None)
+        try:
+            yield
+        finally:
+            after_commit_callbacks.reset(callbacks_token)
+            current_connection.reset(token)
+
+    async def execute_batch(self, statements) -> list:
+        """
+        Выполняет statements [(sql, params), ...] по очереди на одном соединении одной транзакцией
+        (внутри unit_of_work — в ее транзакции). Возвращает rowcount каждого statement.
+        Несколько statements в одном запросе (CLIENT.MULTI_STATEMENTS) не используются намеренно:
+        с этим флагом любая будущая SQL-инъекция могла бы дописать свои запросы.
+        """
+        async with self.unit_of_work():
+            async with self.connection(write=True) as conn:
+                async with conn.cursor() as cur:
+                    rowcounts = []
+                    for sql, params in statements:
+                        await cur.execute(sql, params)
+                        rowcounts.append(cur.rowcount)
+                    return rowcounts
+
+    def stats(self) -> dict:
+        return {
+            "replicas": len(self.replicas),
+            "replica_reads": self.replica_reads,
+            "sticky_reads": self.sticky_reads,
+            "replica_errors": self.replica_errors,
+        }
 
     async def disconnect(self):
+        for pool in self.replicas:
+            pool.close()
+            await pool.wait_closed()
+        self.replicas, self.replica_cycle = [], None
         if self.pool:
             self.pool.close()
             await self.pool.wait_closed()
 
-db = Database()
\ No newline at end of file
+db = Database()
@@ -1,39 +1,47 @@
 import logging
 import httpx
 import random
-from fastapi import FastAPI, HTTPException
+import hmac
+from fastapi import FastAPI, HTTPException, Request
 from contextlib import asynccontextmanager
-from typing import Any
+from typing import Any, Optional
 from db.session import db
+from db.journal import journal
+from db.migrations import apply_indexes, check_query_plans, create_archive_tables
+from db.retention import archiver
 from models.schemas import TransactionData, CalculationData, StatusUpdateData
 from aiogram.types import BufferedInputFile, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from models.schemas import TransactionData, CalculationData, StatusUpdateData, ProfitabilityData, DocumentData
+from models.schemas import TransactionData, CalculationData, StatusUpdateData, ProfitabilityData, DocumentData, BatchVerifyData
 from fastapi.responses import RedirectResponse
 from datetime import datetime
 from aiogram import Dispatcher, types, F, Bot
 from services.bot_service import BotService, bot, TaskCB, DealCB, SecurityTaskCB
 from db.repository import (
-    update_task_status, 
+    set_task_status, 
     set_expected_amount, 
     get_deal_by_id,
     get_task_by_id, 
+    get_task_history,
     log_task_click,
     get_last_active_task,  
-    get_oldest_pending_task,
     get_active_tasks_count,
-    log_task_event,
-    assign_task_to_operator,
-    find_or_create_security_topic,
-    create_security_task,
-    get_employee_by_id,
-    get_online_managers,
     update_security_task_status,
+    deal_cache,
 )
 import asyncio
-from core.constants import STATUS_MAP, OPERATORS_TO_GROUPS, SECURITY_TO_GROUPS, CITIES_TO_GROUPS, MANAGERS_TO_GROUPS
+from core.constants import STATUS_MAP, CITIES_TO_GROUPS, MANAGERS_TO_GROUPS
 from services.crypto_monitor import CryptoMonitor
-from services.operator_logic import security_balancer
+from services.http_pool import http_pool
+from services.tx_cache import tx_cache
+from services.provider_health import provider_health
+from services.wallet_watcher import wallet_watcher
+from core.config import settings
+from services.operator_logic import security_balancer, operator_capacity, registry_authoritative
+from services.operator_state import operator_registry
+from services.dispatcher import dispatcher
+from services.leader import leader
+from services.employee_directory import employee_directory
 
 monitor = CryptoMonitor()
 
@@ -41,24 +49,122 @@ logging.basicConfig(level=logging.INFO)
 
 dp = Dispatcher()
 
+leader_tasks = {}
+# Обновления из webhook, обрабатываемые в фоне
+webhook_updates = set()
+
+def webhook_mode() -> bool:
+    return settings.TELEGRAM_UPDATES_MODE == "webhook"
+
+async def retry_telegram(action, description: str):
+    """Повторяет вызов Bot API, пока он не пройдет: недоступность Telegram не должна мешать старту приложения"""
+    delay = 1.0
+    while True:
+        try:
+            return await action()
+        except Exception as e:
+            logging.warning(f"{description}: ошибка Bot API ({e}), повтор через {delay:.0f} сек.")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60.0)
+
+async def receive_updates():
+    if webhook_mode():
+        # Обновления принимает любой воркер через telegram_webhook, лидер только регистрирует адрес
+        await retry_telegram(lambda: bot.set_webhook(
+            url=settings.WEBHOOK_URL.rstrip("/") + settings.WEBHOOK_PATH,
+            secret_token=settings.WEBHOOK_SECRET
+        ), "Регистрация webhook")
+        logging.info("Telegram webhook registered")
+        return
+    # getUpdates не работает, пока установлен webhook (например, после смены режима)
+    await retry_telegram(bot.delete_webhook, "Удаление webhook")
+    logging.info("Aiogram Polling started")
+    await dp.start_polling(bot, close_bot_session=False)
+
+async def start_leader_jobs():
+    """Работа, которую выполняет только один воркер: получение обновлений Telegram и отслеживание кошельков"""
+    if settings.WALLET_WATCH_ENABLED:
+        wallet_watcher.start()
+    if settings.RETENTION_ENABLED:
+        archiver.start()
+    # В фоне, чтобы сбой Bot API не останавливал старт (регистрация webhook повторяется)
+    leader_tasks['updates'] = asyncio.create_task(receive_updates())
+
+async def stop_leader_jobs():
+    updates_task = leader_tasks.pop('updates', None)
+    if updates_task:
+        updates_task.cancel()
+        await asyncio.gather(updates_task, return_exceptions=True)
+        logging.info("Telegram updates stopped")
+    await wallet_watcher.stop()
+    await archiver.stop()
+
+leader.on_elected.append(start_leader_jobs)
+leader.on_demoted.append(stop_leader_jobs)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # При старте
     await db.connect()
-    
-    # Запускаем polling бота в фоновом режиме, чтобы кнопки работали
-    polling_task = asyncio.create_task(dp.start_polling(bot))
-    logging.info("Aiogram Polling started")
+    try:
+        if settings.DB_APPLY_MIGRATIONS:
+            await apply_indexes()
+        if settings.DB_CHECK_QUERY_PLANS:
+            await check_query_plans()
+    except Exception as e:
+        logging.error(f"Проверка индексов не выполнена: {e}")
+    try:
+        # Архивные таблицы нужны чтению истории (get_task_history) и при выключенном переносе в архив
+        await create_archive_tables()
+    except Exception as e:
+        logging.error(f"Архивные таблицы не созданы: {e}")
+    await journal.start()
+    await employee_directory.start()
+    await operator_registry.start()
+    await dispatcher.start()
+    await http_pool.start()
+    await leader.start()
     
     yield
     
     # При выключении
-    polling_task.cancel()
+    await leader.stop()
+    # Обновления, уже принятые через webhook, дорабатываются до закрытия соединений
+    await asyncio.gather(*webhook_updates, return_exceptions=True)
+    await dispatcher.stop()
+    await operator_registry.stop()
+    await employee_directory.stop()
+    await http_pool.close()
+    await journal.stop()
     await db.disconnect()
     await bot.session.close()
 
 app = FastAPI(title="CryptoOps API", lifespan=lifespan)
 
+async def telegram_webhook(request: Request):
+    """Прием обновлений Telegram в режиме webhook"""
+    secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not hmac.compare_digest(secret, settings.WEBHOOK_SECRET):
+        raise HTTPException(status_code=403, detail="Invalid secret token")
+    update = types.Update.model_validate(await request.json(), context={"bot": bot})
+    # Обработка (например, поиск транзакции до TX_SEARCH_TIMEOUT) дольше таймаута webhook Telegram,
+    # который иначе доставит обновление повторно, — отвечаем сразу, обрабатываем в фоне
+    task = asyncio.create_task(feed_webhook_update(update))
+    webhook_updates.add(task)
+    task.add_done_callback(webhook_updates.discard)
+    return {"ok": True}
+
+async def feed_webhook_update(update: types.Update):
+    try:
+        await dp.feed_update(bot, update)
+    except Exception as e:
+        logging.error(f"Ошибка обработки обновления {update.update_id}: {e}", exc_info=True)
+
+if webhook_mode():
+    if not settings.WEBHOOK_URL or not settings.WEBHOOK_SECRET:
+        raise RuntimeError("Для TELEGRAM_UPDATES_MODE=webhook нужны WEBHOOK_URL и WEBHOOK_SECRET")
+    app.add_api_route(settings.WEBHOOK_PATH, telegram_webhook, methods=["POST"], include_in_schema=False)
+
 @app.post("/transaction/create")
 async def create_tx(data: TransactionData):
     result = await BotService.create_transaction_topic(data)
@@ -171,6 +277,22 @@ async def notify_unprofitable(data: ProfitabilityData):
         logging.error(f"Unprofitable notify error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/transaction/verify-batch")
+async def verify_batch(data: BatchVerifyData):
+    """Пакетная проверка транзакций (например, сверка сделок за день)"""
+    logging.info(f"Получен запрос на пакетную проверку: {len(data.hashes)} хэшей")
+    results, unavailable = await monitor.search_many(data.hashes, data.target_wallet)
+    found = sum(1 for res in results.values() if res)
+    # Хэши, которые не удалось проверить (лимиты провайдеров), — не "не найдено": их стоит проверить позже
+    return {
+        "status": "success",
+        "found": found,
+        "not_found": len(results) - found - len(unavailable),
+        "unavailable": len(unavailable),
+        "unavailable_hashes": sorted(unavailable),
+        "results": results,
+    }
+
 @app.get("/click/{task_id}")
 async def track_op_click(task_id: int):
     """Эндпоинт для фиксации клика оператора"""
@@ -186,14 +308,58 @@ async def track_op_click(task_id: int):
     
     return {"status": "error", "message": "Task not found"}
 
+@app.get("/metrics/tx-cache")
+async def tx_cache_metrics():
+    """Счетчики кэша поиска транзакций"""
+    return tx_cache.stats()
+
+@app.post("/employees/invalidate")
+async def invalidate_employees(employee_id: Optional[int] = None):
+    """Перечитать сотрудника (или весь справочник) после изменения в employees"""
+    await employee_directory.invalidate(employee_id)
+    return {"status": "success"}
+
+@app.get("/tasks/{task_id}/history")
+async def task_history(task_id: int):
+    """Задача и ее события, в том числе перенесенные в архив"""
+    task, events = await get_task_history(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return {"task": task, "events": events}
+
+@app.get("/metrics/retention")
+async def retention_metrics():
+    """Перенос старых задач в архив"""
+    return archiver.stats()
+
+@app.get("/metrics/db")
+async def db_metrics():
+    """Маршрутизация чтений между primary и репликами"""
+    return db.stats()
+
+@app.get("/metrics/deal-cache")
+async def deal_cache_metrics():
+    """Счетчики кэша строк CryptoDeals"""
+    return deal_cache.stats()
+
+@app.get("/metrics/journal")
+async def journal_metrics():
+    """Отложенная запись событий: очередь, отставание от БД, пачки и ошибки"""
+    return journal.stats()
+
+@app.get("/metrics/providers")
+async def providers_metrics():
+    """Состояние провайдеров: circuit breaker, суточная квота, задержка и доля успешных ответов"""
+    return provider_health.stats()
+
 # 1. Нажатие "Принять и перейти"
 @dp.callback_query(TaskCB.filter(F.action == "accept"))
 async def handle_accept(query: types.CallbackQuery, callback_data: TaskCB):
-    task = await get_task_by_id(callback_data.id)
-    await update_task_status(callback_data.id, "active")
-    
-    # ФИКСИРУЕМ ПРИНЯТИЕ
-    await log_task_event(callback_data.id, 'accept')
+    async with db.unit_of_work():
+        task = await get_task_by_id(callback_data.id)
+        # ФИКСИРУЕМ ПРИНЯТИЕ
+        await set_task_status(callback_data.id, "active", 'accept')
+    operator_registry.on_accept(query.from_user.id, callback_data.id, task['assigned_at'], task.get('operator_thread_id'))
     
     await query.message.edit_text(
         f"🟢 <b>Задача #{callback_data.id} в работе</b>\nПринята: {datetime.now().strftime('%H:%M:%S')}",
@@ -240,24 +406,18 @@ async def handle_client_arrived(query: types.CallbackQuery, callback_data: DealC
         return
 
     # --- Логика для СБ остается, но пользователь об этом не узнает ---
-    security_officer = await security_balancer.get_available_security_officer()
-    if not security_officer:
-        await query.answer("Все сотрудники СБ заняты, попробуйте позже.", show_alert=True)
-        return
-
-    security_group_id = SECURITY_TO_GROUPS.get(str(security_officer['personal_telegram_id']))
-    if not security_group_id:
-        await query.answer("Не настроена группа для сотрудника СБ.", show_alert=True)
-        return
-
     client_identifier = deal.get('client_id') or deal.get('client_full_name')
     if not client_identifier:
         await query.answer("Не удалось идентифицировать клиента для создания темы СБ.", show_alert=True)
         return
 
     task_type = "Клиент пришел"
-    topic_id = await find_or_create_security_topic(client_identifier, security_group_id, security_officer['id'], task_type)
-    security_task_id = await create_security_task(deal['deals_id'], security_officer['id'], topic_id, is_deal_task=True)
+    # Выбор сотрудника СБ (только с настроенной группой), тема клиента и задача — под одной блокировкой
+    assignment = await security_balancer.assign_task(deal['deals_id'], client_identifier, task_type, is_deal_task=True)
+    if not assignment:
+        await query.answer("Все сотрудники СБ заняты, попробуйте позже.", show_alert=True)
+        return
+    security_officer, security_group_id, topic_id, security_task_id = assignment
 
     deal_type = "Прямая" if deal.get('direction') == 'direct' else "Обратная"
     city_name = next((city for city, group_id in CITIES_TO_GROUPS.items() if group_id == deal['chat_id']), "Неизвестно")
@@ -303,27 +463,17 @@ async def handle_deal_escalation(query: types.CallbackQuery, callback_data: Deal
         await query.answer("Заявка не найдена!", show_alert=True)
         return
 
-    # 1. Находим свободного сотрудника СБ
-    security_officer = await security_balancer.get_available_security_officer()
-    if not security_officer:
-        await query.answer("Все сотрудники СБ заняты, попробуйте позже.", show_alert=True)
-        return
-
-    # 2. Находим или создаем тему для клиента в чате СБ
-    security_group_id = SECURITY_TO_GROUPS.get(str(security_officer['personal_telegram_id']))
-    if not security_group_id:
-        await query.answer("Не настроена группа для сотрудника СБ.", show_alert=True)
-        return
-
     client_identifier = deal.get('client_id') or deal.get('client_full_name')
     if not client_identifier:
         await query.answer("Не удалось идентифицировать клиента для создания темы СБ.", show_alert=True)
         return
 
-    topic_id = await find_or_create_security_topic(client_identifier, security_group_id, security_officer['id'], task_type)
-
-    # 3. Создаем задачу для СБ (связываем с deal_id)
-    security_task_id = await create_security_task(deal['deals_id'], security_officer['id'], topic_id, is_deal_task=True)
+    # 1-3. Свободный сотрудник СБ, тема клиента в чате СБ и задача СБ (связана с deal_id) — под одной блокировкой
+    assignment = await security_balancer.assign_task(deal['deals_id'], client_identifier, task_type, is_deal_task=True)
+    if not assignment:
+        await query.answer("Все сотрудники СБ заняты, попробуйте позже.", show_alert=True)
+        return
+    security_officer, security_group_id, topic_id, security_task_id = assignment
 
     # 4. Отправляем уведомление в тему СБ
     deal_type = "Прямая" if deal.get('direction') == 'direct' else "Обратная"
@@ -362,23 +512,25 @@ async def handle_deal_escalation(query: types.CallbackQuery, callback_data: Deal
 @dp.callback_query(SecurityTaskCB.filter(F.action == "accept"))
 async def handle_security_accept(query: types.CallbackQuery, callback_data: SecurityTaskCB):
     """СБ принимает перенос/отмену и ставит задачу на ЧМ"""
-    await update_security_task_status(callback_data.deal_id, "accepted")
-    
-    deal = await get_deal_by_id(callback_data.deal_id)
+    # Запись статуса и чтение сделки — на одном соединении и одной транзакцией
+    async with db.unit_of_work():
+        await update_security_task_status(callback_data.deal_id, "accepted")
+        deal = await get_deal_by_id(callback_data.deal_id)
+
     if not deal:
         await query.answer("Сделка не найдена!", show_alert=True)
         return
 
     original_manager_id = deal.get("employee_id")
     target_manager = None
-    
+
     if original_manager_id:
-        manager = await get_employee_by_id(original_manager_id)
+        manager = await employee_directory.get(original_manager_id)
         if manager and manager.get("status") == "online":
             target_manager = manager
 
     if not target_manager:
-        online_managers = await get_online_managers()
+        online_managers = await employee_directory.online_managers()
         if not online_managers:
             await query.answer("Не найдено свободных ЧМ онлайн.", show_alert=True)
             # Тут можно добавить логику постановки в очередь
@@ -450,30 +602,21 @@ async def handle_escalation(query: types.CallbackQuery, callback_data: TaskCB):
     action_text = "перенесена" if callback_data.action == "transfer" else "отклонена"
     action_verb = "Перенос" if callback_data.action == "transfer" else "Отклонение"
 
-    # 1. Находим свободного сотрудника СБ
-    security_officer = await security_balancer.get_available_security_officer()
-    if not security_officer:
-        await query.answer("Все сотрудники СБ заняты, попробуйте позже.", show_alert=True)
-        return
-
-    # 2. Получаем информацию о задаче
+    # 1. Получаем информацию о задаче
     task = await get_task_by_id(callback_data.id)
     if not task:
         await query.answer("Задача не найдена.", show_alert=True)
         return
 
-    # 3. Находим или создаем тему для клиента в чате СБ
-    security_group_id = SECURITY_TO_GROUPS.get(str(security_officer['personal_telegram_id']))
-    if not security_group_id:
-        await query.answer("Не настроена группа для сотрудника СБ.", show_alert=True)
-        return
-
     # Предполагаем, что client_id есть в задаче. Если нет, нужна доп. логика.
     client_id = task.get('client_id', 0) 
-    topic_id = await find_or_create_security_topic(client_id, security_group_id, security_officer['id'])
 
-    # 4. Создаем задачу для СБ (связываем с task_id)
-    security_task_id = await create_security_task(task['id'], security_officer['id'], topic_id)
+    # 2-4. Свободный сотрудник СБ, тема клиента в чате СБ и задача СБ (связана с task_id) — под одной блокировкой
+    assignment = await security_balancer.assign_task(task['id'], client_id, action_verb)
+    if not assignment:
+        await query.answer("Все сотрудники СБ заняты, попробуйте позже.", show_alert=True)
+        return
+    security_officer, security_group_id, topic_id, security_task_id = assignment
 
     # 5. Отправляем уведомление в тему СБ
     await bot.send_message(security_group_id, message_thread_id=topic_id, text=f"🚨 Новая задача от оператора #{security_task_id}!\n<b>Действие:</b> {action_verb}\n<b>Оператор:</b> @{query.from_user.username}", parse_mode="HTML")
@@ -484,10 +627,10 @@ async def handle_escalation(query: types.CallbackQuery, callback_data: TaskCB):
 # 2. Нажатие "Пауза"
 @dp.callback_query(TaskCB.filter(F.action == "pause"))
 async def handle_pause(query: types.CallbackQuery, callback_data: TaskCB):
-    await update_task_status(callback_data.id, "paused")
-    
     # ФИКСИРУЕМ ПАУЗУ
-    await log_task_event(callback_data.id, 'pause')
+    await set_task_status(callback_data.id, "paused", 'pause')
+    operator_registry.on_pause(query.from_user.id, callback_data.id)
+    dispatcher.kick()
     
     await query.message.edit_text(
         f"🟡 <b>Задача #{callback_data.id} на паузе</b>\nВы свободны для других задач.",
@@ -499,16 +642,18 @@ async def handle_pause(query: types.CallbackQuery, callback_data: TaskCB):
 # 3. Нажатие "Продолжить"
 @dp.callback_query(TaskCB.filter(F.action == "resume"))
 async def handle_resume(query: types.CallbackQuery, callback_data: TaskCB):
-    active_count = await get_active_tasks_count(query.from_user.id)
-    if active_count > 0:
+    active_count = operator_registry.active_count(query.from_user.id) if registry_authoritative() else None
+    if active_count is None:
+        active_count = await get_active_tasks_count(query.from_user.id)
+    if active_count >= operator_capacity(query.from_user.id):
         await query.answer("❌ Сначала завершите текущую активную задачу!", show_alert=True)
         return
 
-    task = await get_task_by_id(callback_data.id)
-    await update_task_status(callback_data.id, "active")
-    
-    # ФИКСИРУЕМ ПРОДОЛЖЕНИЕ
-    await log_task_event(callback_data.id, 'resume')
+    async with db.unit_of_work():
+        task = await get_task_by_id(callback_data.id)
+        # ФИКСИРУЕМ ПРОДОЛЖЕНИЕ
+        await set_task_status(callback_data.id, "active", 'resume')
+    operator_registry.on_resume(query.from_user.id, callback_data.id, task['assigned_at'], task.get('operator_thread_id'))
     
     await query.message.edit_text(
         f"🟢 <b>Задача #{callback_data.id} снова в работе</b>",
@@ -531,16 +676,27 @@ async def handle_complete_request(query: types.CallbackQuery, callback_data: Tas
 @dp.message(F.text.regexp(r'[a-zA-Z0-9+/=]{32,}'))
 async def verify_transaction(message: types.Message):
     tx_hash = message.text.strip()
-    task = await get_last_active_task(message.from_user.id)
+    task = None
+    if registry_authoritative():
+        # При емкости больше 1 задача определяется по топику, в который прислан хэш, иначе берется
+        # последняя назначенная. Выбор — по реестру; строка задачи читается одним запросом:
+        # кошелек и сумма пишутся вне обработчиков (API расчета, внешние системы)
+        task_id = operator_registry.active_task_for_thread(message.from_user.id, message.message_thread_id)
+        if task_id is not None:
+            task = await get_task_by_id(task_id)
+            if task and task.get('status') != 'active':
+                task = None
+    if task is None:
+        # Реестр мог еще не узнать о задаче (принята через другой воркер до сверки) — источник истины БД
+        task = await get_last_active_task(message.from_user.id)
     
     if not task:
         await message.answer("❌ У вас нет активных задач.")
         return
 
     # 1. Запускаем поиск (используем search_tx, который возвращает словарь)
-    loop = asyncio.get_event_loop()
     # Передаем кошелек для проверки безопасности
-    tx_data = await loop.run_in_executor(None, monitor.search_tx, tx_hash, task.get('wallet_address'))
+    tx_data = await monitor.search_tx(tx_hash, task.get('wallet_address'))
 
     if not tx_data:
         await message.answer("❌ Транзакция не найдена в сети или адрес получателя не совпадает.")
@@ -549,37 +705,16 @@ async def verify_transaction(message: types.Message):
     # 2. Формируем красивый отчет
     expected = float(task.get('expected_amount', 0))
     found = tx_data['amount']
-    
-    reply_text = (
-        f"✅ <b>Транзакция найдена!</b>\n\n"
-        f"🪙 <b>Крипта:</b> {tx_data['symbol']}\n"
-        f"💰 <b>Сумма:</b> {found} (Ожидалось: {expected})\n"
-        f"👤 <b>От:</b> <code>{tx_data['from_addr']}</code>\n"
-        f"🏦 <b>Куда:</b> <code>{tx_data['to_addr']}</code>\n"
-        f"🕒 <b>Дата:</b> {tx_data['dt']}\n"
-    )
+    reply_text = BotService.format_tx_report(tx_data, expected)
 
     # 3. Сверка и завершение
-    if abs(found - expected) < 0.01:
-        await update_task_status(task['id'], "completed")
-        await log_task_event(task['id'], 'complete')
+    if abs(found - expected) < settings.AMOUNT_TOLERANCE:
+        # Задачу мог одновременно завершить WalletWatcher по тому же платежу
+        if not await BotService.complete_task(task['id'], message.from_user.id, from_statuses=('active',)):
+            await message.answer(reply_text + "\n⚠️ <b>Задача уже закрыта.</b>", parse_mode="HTML")
+            return
         await message.answer(reply_text + "\n✅ <b>Сумма совпала! Задача завершена.</b>", parse_mode="HTML")
-        
-        # Логика очереди
-        pending_task = await get_oldest_pending_task()
-        if pending_task:
-            op_id = str(message.from_user.id)
-            op_group = OPERATORS_TO_GROUPS.get(op_id)
-            
-            if op_group:
-                # 1. Привязываем задачу к оператору
-                await assign_task_to_operator(pending_task['id'], op_id)
-                # 2. Вызываем тот же самый метод создания топика
-                await BotService.create_operator_topic(
-                    pending_task['id'], 
-                    op_group, 
-                    pending_task['message_thread_id']
-                )
+        dispatcher.kick()
     else:
         await message.answer(reply_text + "\n❌ <b>Сумма не совпала!</b>", parse_mode="HTML")
 
@@ -1,5 +1,6 @@
-from pydantic import BaseModel, ConfigDict
-from typing import Optional, Union, Any
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+from typing import Optional, Union, Any, List
+from core.config import settings
 
 class TransactionData(BaseModel):
     city_id: Union[int, str]
@@ -50,4 +51,22 @@ class DocumentData(BaseModel):
     chat_id: Union[int, str]
     message_thread_id: Union[int, str]
     file_url: str
-    model_config = ConfigDict(extra="allow")
\ No newline at end of file
+    model_config = ConfigDict(extra="allow")
+
+class BatchVerifyData(BaseModel):
+    # Пакет делит бюджеты и rate limit провайдеров с интерактивной проверкой — размер ограничен
+    hashes: List[str] = Field(min_length=1, max_length=settings.TX_BATCH_MAX_HASHES)
+    target_wallet: Optional[str] = None
+    model_config = ConfigDict(extra="allow")
+
+    @field_validator("hashes", mode="before")
+    @classmethod
+    def unique_hashes(cls, value):
+        """
+        Убирает пустые и повторяющиеся хэши (до проверки размера пакета).
+        Элементы не-строки оставляются как есть — их отклоняет проверка типа List[str] (422)
+        """
+        if not isinstance(value, list):
+            return value
+        hashes = list(dict.fromkeys(h.strip() for h in value if isinstance(h, str) and h.strip()))
+        return hashes + [h for h in value if not isinstance(h, str)]
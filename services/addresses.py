@@ -0,0 +1,133 @@
+import base64
+import hashlib
+import re
+import struct
+from functools import lru_cache
+
+# --- CRC16-CCITT (XMODEM), используется в user-friendly адресах TON ---
+
+def _make_crc16_table():
+    table = []
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+        table.append(crc & 0xFFFF)
+    return tuple(table)
+
+CRC16_TABLE = _make_crc16_table()
+
+
+def crc16(data: bytes) -> int:
+    crc = 0
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFF) ^ CRC16_TABLE[(crc >> 8) ^ byte]
+    return crc
+
+
+# --- TON: raw (0:abc...) и user-friendly (EQ.../UQ...) ---
+
+TON_BOUNCEABLE_TAG = 0x11
+TON_NON_BOUNCEABLE_TAG = 0x51
+TON_TESTNET_FLAG = 0x80
+TON_RAW_RE = re.compile(r"^-?\d+:[0-9a-fA-F]{64}$")
+TON_FRIENDLY_RE = re.compile(r"^[A-Za-z0-9_+/-]{48}$")
+
+
+@lru_cache(maxsize=65536)
+def ton_raw_to_friendly(raw_addr, bounceable=False, testnet=False):
+    """Конвертирует адрес из 0:abc в user-friendly (по умолчанию UQ..., non-bounceable)"""
+    workchain, address_hex = raw_addr.split(":")
+    tag = TON_BOUNCEABLE_TAG if bounceable else TON_NON_BOUNCEABLE_TAG
+    if testnet:
+        tag |= TON_TESTNET_FLAG
+    data = struct.pack("Bb", tag, int(workchain)) + bytes.fromhex(address_hex)
+    return base64.urlsafe_b64encode(data + struct.pack(">H", crc16(data))).decode()
+
+
+def ton_friendly_to_raw(friendly):
+    """Конвертирует user-friendly адрес TON (любой флаг bounceable/testnet, base64 или base64url) в 0:abc"""
+    data = base64.urlsafe_b64decode(friendly.replace("+", "-").replace("/", "_"))
+    if len(data) != 36 or crc16(data[:34]) != struct.unpack(">H", data[34:])[0]:
+        raise ValueError(f"Некорректный адрес TON: {friendly}")
+    workchain = struct.unpack("b", data[1:2])[0]
+    return f"{workchain}:{data[2:34].hex()}"
+
+
+# --- TRON: base58check (T...) и hex (41...) ---
+
+BASE58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+BASE58_INDEX = {char: i for i, char in enumerate(BASE58_ALPHABET)}
+TRON_HEX_RE = re.compile(r"^41[0-9a-fA-F]{40}$")
+TRON_B58_RE = re.compile(r"^T[1-9A-HJ-NP-Za-km-z]{33}$")
+
+
+def _checksum(payload: bytes) -> bytes:
+    return hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4]
+
+
+def tron_base58_to_hex(address):
+    num = 0
+    for char in address:
+        num = num * 58 + BASE58_INDEX[char]
+    data = num.to_bytes(25, "big")
+    payload, checksum = data[:21], data[21:]
+    if payload[0] != 0x41 or _checksum(payload) != checksum:
+        raise ValueError(f"Некорректный адрес TRON: {address}")
+    return payload.hex()
+
+
+def tron_hex_to_base58(address_hex):
+    payload = bytes.fromhex(address_hex)
+    num = int.from_bytes(payload + _checksum(payload), "big")
+    encoded = ""
+    while num:
+        num, rem = divmod(num, 58)
+        encoded = BASE58_ALPHABET[rem] + encoded
+    return encoded
+
+
+def tron_base58(address):
+    """Адрес TRON в виде T... (формат, который принимают API Tronscan)"""
+    address = (address or "").strip()
+    return tron_hex_to_base58(address) if TRON_HEX_RE.match(address) else address
+
+
+# --- Канонические формы ---
+
+EVM_RE = re.compile(r"^0x[0-9a-fA-F]{40}$")
+BECH32_RE = re.compile(r"^(bc1|tb1|ltc1)[0-9a-zA-Z]+$", re.IGNORECASE)
+
+
+@lru_cache(maxsize=65536)
+def canonical(address):
+    """
+    Каноническая форма адреса для сравнения между форматами одной сети:
+    EVM — нижний регистр (чексумма EIP-55 игнорируется), TRON — 41-hex, TON — workchain:hex,
+    bech32 — нижний регистр. Нераспознанные адреса сравниваются как есть.
+    """
+    address = (address or "").strip()
+    try:
+        if EVM_RE.match(address):
+            return "evm:" + address.lower()
+        if TRON_B58_RE.match(address):
+            return "tron:" + tron_base58_to_hex(address)
+        if TRON_HEX_RE.match(address):
+            return "tron:" + address.lower()
+        if TON_RAW_RE.match(address):
+            workchain, address_hex = address.split(":")
+            return f"ton:{int(workchain)}:{address_hex.lower()}"
+        if TON_FRIENDLY_RE.match(address):
+            return "ton:" + ton_friendly_to_raw(address)
+        if BECH32_RE.match(address):
+            return address.lower()
+    except (ValueError, OverflowError):
+        pass
+    return address
+
+
+def same_address(a, b) -> bool:
+    """Один ли это адрес (с учетом разных форм записи); пустые адреса не совпадают ни с чем"""
+    if not a or not b:
+        return False
+    return canonical(a) == canonical(b)
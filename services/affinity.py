@@ -0,0 +1,36 @@
+from core.cache import TTLCache
+from core.config import settings
+from db.repository import get_last_operator_assignment
+
+
+class TopicAffinity:
+    """
+    Привязка топика заявки (chat_id, message_thread_id) к оператору и его топику.
+    Повторный расчет по той же сделке уходит тому же оператору в уже созданный топик.
+    Кэш в памяти, при промахе — последнее назначение из task_logs.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.cache = TTLCache(maxsize, ttl)
+
+    @staticmethod
+    def key(chat_id, message_thread_id):
+        return (str(chat_id), message_thread_id)
+
+    async def get(self, chat_id, message_thread_id):
+        """(operator_id, operator_thread_id) последнего назначения или None"""
+        key = self.key(chat_id, message_thread_id)
+        found = self.cache.get(key)
+        if found is None:
+            row = await get_last_operator_assignment(str(chat_id), message_thread_id)
+            if not row:
+                return None
+            found = (str(row['operator_id']), row['operator_thread_id'])
+            self.cache.set(key, found)
+        return found
+
+    def remember(self, chat_id, message_thread_id, operator_id, operator_thread_id):
+        self.cache.set(self.key(chat_id, message_thread_id), (str(operator_id), operator_thread_id))
+
+
+topic_affinity = TopicAffinity(settings.AFFINITY_CACHE_MAXSIZE, settings.AFFINITY_TTL)
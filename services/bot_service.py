@@ -1,10 +1,17 @@
 import random
 import httpx
 from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from core.config import settings
 from core.constants import CITIES_TO_GROUPS, OPERATORS_TO_GROUPS, MANAGERS_TO_GROUPS
-from db.repository import get_online_operators, create_task_log, update_operator_thread
+from db.repository import (
+    create_task_log, update_operator_thread, set_task_status,
+)
 from services.operator_logic import balancer 
+from services.operator_state import operator_registry
+from services.affinity import topic_affinity
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from datetime import datetime
@@ -13,7 +20,11 @@ import logging
 
 log = logging.getLogger(__name__)
 
-bot = Bot(token=settings.BOT_TOKEN)
+bot = Bot(
+    token=settings.BOT_TOKEN,
+    session=AiohttpSession(api=TelegramAPIServer.from_base(settings.TELEGRAM_API_SERVER))
+    if settings.TELEGRAM_API_SERVER else None
+)
 
 class TaskCB(CallbackData, prefix="task"):
     action: str
@@ -120,9 +131,10 @@ class BotService:
         # --- УВЕДОМЛЕНИЕ СОЗДАТЕЛЮ ---
         try:
             if data.creator_id:
-                from db.repository import get_employee_by_id, update_deal_creator_topic
+                from db.repository import update_deal_creator_topic
+                from services.employee_directory import employee_directory
                 
-                employee = await get_employee_by_id(data.creator_id)
+                employee = await employee_directory.get(data.creator_id)
 
                 if employee and 'personal_telegram_id' in employee:
                     manager_tg_id = str(employee['personal_telegram_id'])
@@ -223,19 +235,76 @@ class BotService:
         )
         return new_op_topic.message_thread_id
 
+    @staticmethod
+    async def reuse_operator_topic(task_id, op_group, op_thread_id):
+        """Шлет кнопку 'Принять' повторной задачи в уже существующий топик оператора"""
+        await update_operator_thread(task_id, op_thread_id)
+        await bot.send_message(
+            chat_id=op_group,
+            message_thread_id=op_thread_id,
+            text=f"🔁 <b>Повторный расчет по этой заявке!</b>\nЗадача #{task_id}, поставлена: {datetime.now().strftime('%H:%M:%S')}",
+            reply_markup=BotService.get_task_keyboard(task_id, "pending"),
+            parse_mode="HTML"
+        )
+        return op_thread_id
+
+    @staticmethod
+    async def deliver_task(task_id, op_id, op_group, chat_id, thread_id_original):
+        """
+        Отправляет задачу оператору. Если этот оператор уже вел заявку из того же топика,
+        задача приходит в его прежний топик, иначе создается новый.
+        """
+        previous = await topic_affinity.get(chat_id, thread_id_original)
+        op_thread_id = None
+        if previous and previous[0] == str(op_id) and previous[1]:
+            try:
+                op_thread_id = await BotService.reuse_operator_topic(task_id, op_group, previous[1])
+            except TelegramBadRequest as e:
+                # Топик удален или закрыт — создаем новый
+                log.warning(f"Не удалось использовать топик {previous[1]} оператора {op_id}: {e}")
+        if op_thread_id is None:
+            op_thread_id = await BotService.create_operator_topic(task_id, op_group, thread_id_original)
+        topic_affinity.remember(chat_id, thread_id_original, op_id, op_thread_id)
+        return op_thread_id
+
     @staticmethod
     async def assign_operator_and_notify(data):
-        target_op = await balancer.get_available_operator()
+        # Повторный запрос по той же заявке — в первую очередь прежнему оператору
+        previous = await topic_affinity.get(data.chat_id, data.message_thread_id)
+        target_op, task_id = await balancer.assign_new_task(
+            str(data.chat_id), data.message_thread_id, data.link, preferred=previous[0] if previous else None
+        )
         if not target_op:
-            await create_task_log("queue", str(data.chat_id), data.message_thread_id, data.link, datetime.now())
+            task_id = await create_task_log("queue", str(data.chat_id), data.message_thread_id, data.link, datetime.now())
+            from services.dispatcher import dispatcher
+            await dispatcher.enqueue(task_id)
             return "⏳ В очереди (все заняты)"
 
         op_id = str(target_op['personal_telegram_id'])
         op_group = OPERATORS_TO_GROUPS.get(op_id)
-        task_id = await create_task_log(op_id, str(data.chat_id), data.message_thread_id, data.link, datetime.now())
 
         if op_group:
-            await BotService.create_operator_topic(task_id, op_group, data.message_thread_id)
+            await BotService.deliver_task(task_id, op_id, op_group, data.chat_id, data.message_thread_id)
             return f"@{target_op['personal_telegram_username']}"
         
-        return "Ошибка: группа не настроена"
\ No newline at end of file
+        return "Ошибка: группа не настроена"
+
+    @staticmethod
+    def format_tx_report(tx_data, expected) -> str:
+        """Отчет о найденной транзакции для оператора"""
+        return (
+            f"✅ <b>Транзакция найдена!</b>\n\n"
+            f"🪙 <b>Крипта:</b> {tx_data['symbol']}\n"
+            f"💰 <b>Сумма:</b> {tx_data['amount']} (Ожидалось: {expected})\n"
+            f"👤 <b>От:</b> <code>{tx_data['from_addr']}</code>\n"
+            f"🏦 <b>Куда:</b> <code>{tx_data['to_addr']}</code>\n"
+            f"🕒 <b>Дата:</b> {tx_data['dt']}\n"
+        )
+
+    @staticmethod
+    async def complete_task(task_id, operator_id, from_statuses=None) -> bool:
+        """Завершает задачу оператора. С from_statuses — только из этих статусов; False — если задача уже в другом"""
+        if not await set_task_status(task_id, "completed", 'complete', from_statuses=from_statuses):
+            return False
+        operator_registry.on_complete(operator_id, task_id)
+        return True
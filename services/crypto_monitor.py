@@ -1,46 +1,276 @@
-import requests
+import asyncio
+import time
+import httpx
+from urllib.parse import urlsplit
 from datetime import datetime
-import base64
-import struct
+from core.config import settings
+from core.constants import TOKEN_CONTRACTS
+from services.tx_classifier import candidate_chains, chains_for_wallet
+from services.addresses import same_address, ton_raw_to_friendly, tron_base58
+from services.http_pool import http_pool
+from services.tx_cache import tx_cache
+from services.provider_health import provider_health, ProviderUnavailable, THROTTLE_STATUSES
+
+# Сети, которые Blockchair отдает пачкой через dashboards/transactions/{h1},{h2},...
+BLOCKCHAIR_NETWORKS = {
+    "ethereum": "ethereum",
+    "base": "base",
+    "bsc": "binance-smart-chain",
+    "arbitrum": "arbitrum",
+    "polygon": "polygon",
+    "dogecoin": "dogecoin",
+}
+BLOCKCHAIR_BATCH_SIZE = 10
+BLOCKCHAIR_HOST = "api.blockchair.com"
+
+# Символ нативной валюты EVM сети в формате Blockchair
+NATIVE_SYMBOLS = {
+    "ethereum": "ETH",
+    "base": "ETH (Base)",
+    "binance-smart-chain": "BNB",
+}
 
 class CryptoMonitor:
-    def __init__(self):
+    def __init__(self, cache=tx_cache, health=provider_health):
+        self.cache = cache
+        self.health = health
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
         }
+        # Проверки по сетям: сеть -> функция(tx_hash, target_wallet), возвращающая корутину
+        self.checkers = {
+            "ethereum": lambda tx_hash, wallet: self.check_eth_erc20(tx_hash.lower(), wallet),
+            "base": lambda tx_hash, wallet: self.check_base(tx_hash.lower(), wallet),
+            "bsc": lambda tx_hash, wallet: self.check_bsc(tx_hash.lower(), wallet),
+            "arbitrum": lambda tx_hash, wallet: self.check_evm_universal(tx_hash.lower(), "arbitrum", wallet),
+            "polygon": lambda tx_hash, wallet: self.check_evm_universal(tx_hash.lower(), "polygon", wallet),
+            "ton": self.check_ton,
+            "tron": self.check_tron,
+            "bitcoin": self.check_bitcoin,
+            "dogecoin": self.check_doge,
+            "monero": self.check_xmr,
+        }
 
-    def search_tx(self, tx_hash, target_wallet=None):
+    async def search_tx(self, tx_hash, target_wallet=None, timeout=None):
         """
         Единая точка входа для поиска транзакции.
+        Сети-кандидаты определяются по формату хэша и кошелька (services.tx_classifier).
+        Найденные транзакции и недавние промахи по сетям берутся из кэша (services.tx_cache).
+        Опрашивает подходящие сети параллельно и возвращает первый найденный результат,
+        оставшиеся запросы отменяются. Общее время поиска ограничено timeout
+        (по умолчанию settings.TX_SEARCH_TIMEOUT).
         Возвращает словарь с данными {symbol, amount, from_addr, to_addr, dt} или None.
         """
         tx_hash = tx_hash.strip()
-        clean_hash_lower = tx_hash.lower()
-        
-        # 1. Сначала пробуем EVM сети (они начинаются на 0x)
-        if tx_hash.startswith("0x"):
-            res = (
-                self.check_eth_erc20(clean_hash_lower, target_wallet) or
-                self.check_base(clean_hash_lower, target_wallet) or
-                self.check_bsc(clean_hash_lower, target_wallet) or
-                self.check_evm_universal(clean_hash_lower, "arbitrum", target_wallet) or
-                self.check_evm_universal(clean_hash_lower, "polygon", target_wallet)
-            )
-            if res: return res
-
-        # 2. Пробуем остальные сети
-        res = (
-            self.check_ton(tx_hash) or
-            self.check_tron(tx_hash, target_wallet) or
-            self.check_bitcoin(tx_hash, target_wallet) or
-            self.check_doge(tx_hash, target_wallet) or
-            self.check_xmr(tx_hash, target_wallet)
-        )
-        if res: return res
+
+        cached = self.cache.get(tx_hash, target_wallet)
+        if cached:
+            return cached
+
+        chains = candidate_chains(tx_hash, target_wallet)
+        if not chains:
+            print(f"❌ Неизвестный формат хэша транзакции: {tx_hash}")
+            return None
+
+        # Сети, где транзакцию недавно не нашли, не опрашиваем повторно
+        chains = [chain for chain in chains if not self.cache.is_not_found(tx_hash, target_wallet, chain)]
+        res = await self._search_chains(tx_hash, target_wallet, chains, timeout)
+        if res:
+            return res
 
         print("❌ Транзакция не найдена ни в одной из поддерживаемых сетей.")
         return None
 
+    async def _search_chains(self, tx_hash, target_wallet, chains, timeout=None, unchecked=None):
+        """
+        Опрашивает сети параллельно (см. search_tx) и кэширует найденное.
+        unchecked — множество, в котором остаются сети без ответа по существу (провайдер недоступен, таймаут).
+        """
+        if unchecked is None:
+            unchecked = set()
+        unchecked.update(chains)
+        probes = {chain: self._probe(chain, tx_hash, target_wallet, unchecked) for chain in chains}
+        res = await self._first_match(probes, timeout or settings.TX_SEARCH_TIMEOUT)
+        if res:
+            self.cache.put(tx_hash, target_wallet, res)
+        return res
+
+    async def search_many(self, tx_hashes, target_wallet=None, concurrency=None):
+        """
+        Пакетный поиск транзакций. Возвращает ({хэш: результат или None}, множество хэшей,
+        которые проверить не удалось): для них None означает "провайдер недоступен", а не "не найдено".
+        Сети Blockchair запрашиваются пачками (dashboards/transactions/{h1},{h2},...) по одной сети за раз,
+        уже найденные хэши в следующую сеть не отправляются. Одновременных пачек — не больше размера
+        "ведра" Blockchair, иначе пачки сами упираются в его rate limit. Остальные сети — поштучно
+        с ограниченной параллельностью (concurrency). Сети Blockchair, недоступные для пачки,
+        поштучно повторно не опрашиваются: это тот же провайдер с тем же лимитом.
+        """
+        results = {}
+        candidates = {}
+        unchecked = {}
+        for tx_hash in dict.fromkeys(h.strip() for h in tx_hashes if h and h.strip()):
+            results[tx_hash] = self.cache.get(tx_hash, target_wallet)
+            if not results[tx_hash]:
+                candidates[tx_hash] = [
+                    chain for chain in candidate_chains(tx_hash, target_wallet)
+                    if not self.cache.is_not_found(tx_hash, target_wallet, chain)
+                ]
+                unchecked[tx_hash] = set()
+
+        # 1. Пачки Blockchair: сети по очереди, по BLOCKCHAIR_BATCH_SIZE еще не найденных хэшей в пачке.
+        # После первого отказа Blockchair остальные пачки не отправляются — они упрутся в тот же лимит
+        batch_slots = asyncio.Semaphore(self.health.burst(BLOCKCHAIR_HOST))
+        blockchair = {"available": True}
+
+        async def _run_batch(chain, hashes):
+            async with batch_slots:
+                found = await self._blockchair_batch(chain, hashes, target_wallet) if blockchair["available"] else None
+            if found is None:
+                blockchair["available"] = False
+                for tx_hash in hashes:
+                    unchecked[tx_hash].add(chain)
+                return
+            for tx_hash, res in found.items():
+                if res and not results[tx_hash]:
+                    results[tx_hash] = res
+                    self.cache.put(tx_hash, target_wallet, res)
+
+        for chain in BLOCKCHAIR_NETWORKS:
+            hashes = [h for h, chains in candidates.items() if chain in chains and not results[h]]
+            await asyncio.gather(*(
+                _run_batch(chain, hashes[i:i + BLOCKCHAIR_BATCH_SIZE])
+                for i in range(0, len(hashes), BLOCKCHAIR_BATCH_SIZE)
+            ))
+
+        # 2. Остальные сети — поштучно
+        semaphore = asyncio.Semaphore(concurrency or settings.TX_BATCH_CONCURRENCY)
+
+        async def _run_single(tx_hash):
+            chains = [chain for chain in candidates[tx_hash] if chain not in BLOCKCHAIR_NETWORKS]
+            if not chains:
+                return
+            async with semaphore:
+                results[tx_hash] = await self._search_chains(tx_hash, target_wallet, chains, unchecked=unchecked[tx_hash])
+
+        await asyncio.gather(*(_run_single(h) for h in candidates if not results[h]))
+        unavailable = {h for h in candidates if not results[h] and unchecked[h]}
+        return results, unavailable
+
+    async def _blockchair_batch(self, chain, tx_hashes, target_wallet=None):
+        """
+        Один запрос Blockchair на несколько хэшей одной сети.
+        Возвращает {хэш: результат}; хэши, которых нет в ответе, помечаются в кэше как не найденные.
+        None — пачку проверить не удалось (лимит, ошибка провайдера), промахи в кэш не пишутся.
+        """
+        network = BLOCKCHAIR_NETWORKS[chain]
+        hashes = [h.lower() for h in tx_hashes] if chain != "dogecoin" else list(tx_hashes)
+        url = f"https://{BLOCKCHAIR_HOST}/{network}/dashboards/transactions/{','.join(hashes)}"
+        try:
+            res = await self._get(url, headers=self.headers, timeout=15)
+            if res.status_code != 200:
+                print(f"  [LOG] Blockchair batch {chain}: HTTP {res.status_code}")
+                return None
+            data = res.json().get("data") or {}
+        except ProviderUnavailable as e:
+            print(f"  [LOG] {chain}: {e}")
+            return None
+        except Exception as e:
+            print(f"  [LOG] Blockchair batch {chain} Error: {e}")
+            return None
+
+        found = {}
+        for tx_hash, key in zip(tx_hashes, hashes):
+            entry = data.get(key)
+            try:
+                if not entry:
+                    found[tx_hash] = None
+                elif chain == "dogecoin":
+                    found[tx_hash] = self._parse_blockchair_doge(entry, target_wallet)
+                else:
+                    found[tx_hash] = self._parse_blockchair_evm(entry, network, target_wallet)
+            except Exception as e:
+                found[tx_hash] = None
+            if not found[tx_hash]:
+                self.cache.mark_not_found(tx_hash, target_wallet, chain)
+        return found
+
+    async def _probe(self, chain, tx_hash, target_wallet, unchecked):
+        """
+        Проверка одной сети с записью промаха в кэш.
+        Недоступность провайдера не считается промахом и в кэш не попадает, сеть остается в unchecked.
+        """
+        try:
+            res = await self.checkers[chain](tx_hash, target_wallet)
+        except ProviderUnavailable as e:
+            print(f"  [LOG] {chain}: {e}")
+            return None
+        unchecked.discard(chain)
+        if not res:
+            self.cache.mark_not_found(tx_hash, target_wallet, chain)
+        return res
+
+    async def _first_match(self, probes, timeout):
+        """
+        Запускает проверки сетей параллельно и возвращает первый непустой результат.
+        probes: {сеть: корутина проверки}. По истечении timeout возвращает None.
+        """
+        tasks = [asyncio.create_task(coro, name=f"probe:{chain}") for chain, coro in probes.items()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        pending = set(tasks)
+        try:
+            while pending:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    print(f"  [LOG] Поиск прерван по таймауту ({timeout} сек.)")
+                    return None
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.cancelled() or task.exception():
+                        continue
+                    if task.result():
+                        return task.result()
+            return None
+        finally:
+            # Отменяем проверки, которые еще выполняются
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _get(self, url, timeout=10, **kwargs):
+        """
+        GET-запрос к API провайдера через общий keep-alive пул (services.http_pool).
+        Учитывает лимиты и здоровье провайдера (services.provider_health):
+        402/429/5xx и сетевые ошибки превращаются в ProviderUnavailable, а не в "не найдено".
+        """
+        host = urlsplit(url).hostname
+        await self.health.before_request(host)
+        started = time.monotonic()
+        try:
+            res = await http_pool.client_for(url).get(url, timeout=timeout, **kwargs)
+        except httpx.HTTPError as e:
+            self.health.record_failure(host)
+            raise ProviderUnavailable(f"{host}: {type(e).__name__}") from e
+        except BaseException:
+            # Проверку отменили (проигравшая сеть в _first_match) — иначе half-open остался бы занят навсегда
+            self.health.release_probe(host)
+            raise
+
+        latency = time.monotonic() - started
+        if res.status_code in THROTTLE_STATUSES:
+            retry_after = res.headers.get("Retry-After", "")
+            self.health.record_failure(
+                host, latency,
+                retry_after=float(retry_after) if retry_after.isdigit() else settings.BREAKER_RECOVERY_TIMEOUT,
+            )
+            raise ProviderUnavailable(f"{host}: HTTP {res.status_code}")
+        if res.status_code >= 500:
+            self.health.record_failure(host, latency)
+            raise ProviderUnavailable(f"{host}: HTTP {res.status_code}")
+
+        self.health.record_success(host, latency)
+        return res
+
     def _format_result(self, symbol, amount, from_addr, to_addr, dt):
         return {
             "symbol": str(symbol),
@@ -55,482 +285,570 @@ class CryptoMonitor:
         if not raw_addr or ":" not in raw_addr:
             return raw_addr
         try:
-            workchain, address_hex = raw_addr.split(":")
-            workchain = int(workchain)
-            address_bytes = bytes.fromhex(address_hex)
-            
-            # 0x51 - это префикс для Non-bounceable (начинаются на UQ)
-            # Именно его используют современные кошельки по умолчанию
-            tag = 0x51 
-            chain_id = workchain & 0xFF
-            
-            data = struct.pack("BB", tag, chain_id) + address_bytes
-            
-            # Вычисление CRC16 (контрольная сумма)
-            crc = 0
-            for byte in data:
-                crc ^= (byte << 8)
-                for _ in range(8):
-                    if crc & 0x8000:
-                        crc = (crc << 1) ^ 0x1021
-                    else:
-                        crc <<= 1
-            crc &= 0xFFFF
-            
-            full_data = data + struct.pack(">H", crc)
-            # Используем urlsafe base64
-            res = base64.urlsafe_b64encode(full_data).decode().replace("=", "")
-            return res
-        except:
+            return ton_raw_to_friendly(raw_addr)
+        except ValueError:
             return raw_addr
 
-    def check_ton(self, tx_hash):
+    async def check_ton(self, tx_hash, target_wallet=None):
         import urllib.parse
         
         url = f"https://tonapi.io/v2/events/{urllib.parse.quote(tx_hash)}"
         print(f"  [LOG] TON...")
         
         try:
-            res = requests.get(url, headers=self.headers, timeout=15)
+            res = await self._get(url, headers=self.headers, timeout=15)
             if res.status_code != 200: return None
-            data = res.json()
-            actions = data.get("actions", [])
-            if not actions: return None
+            return self._parse_ton_event(res.json(), target_wallet)
+        except ProviderUnavailable:
+            raise
+        except Exception as e:
+            return None
+
+    def _parse_ton_event(self, data, target_wallet=None):
+        """Первый перевод в событии tonapi (на целевой кошелек, если он указан)"""
+        for recipient, result in self._ton_transfers(data):
+            if not target_wallet or same_address(recipient, target_wallet):
+                return result
+        return None
 
-            for action in actions:
-                action_type = action.get("type")
-                details = action.get("TonTransfer") or action.get("JettonTransfer") or \
-                          action.get("ton_transfer") or action.get("jetton_transfer")
+    def _ton_transfers(self, data):
+        """Перебирает переводы TON/Jetton в событии tonapi: (raw адрес получателя, результат)"""
+        for action in data.get("actions", []):
+            action_type = action.get("type")
+            details = action.get("TonTransfer") or action.get("JettonTransfer") or \
+                      action.get("ton_transfer") or action.get("jetton_transfer")
+            
+            if details:
+                # Определяем символ и количество знаков после запятой
+                symbol, decimals = "TON", 9
+                if action_type == "JettonTransfer":
+                    j_info = details.get("jetton", {})
+                    symbol = j_info.get("symbol", "TOKEN")
+                    decimals = j_info.get("decimals", 9)
+
+                amount = int(details.get("amount", 0)) / 10**decimals
                 
-                if details:
-                    # Определяем символ и количество знаков после запятой
-                    symbol, decimals = "TON", 9
-                    if action_type == "JettonTransfer":
-                        j_info = details.get("jetton", {})
-                        symbol = j_info.get("symbol", "TOKEN")
-                        decimals = j_info.get("decimals", 9)
-
-                    amount = int(details.get("amount", 0)) / 10**decimals
-                    
-                    # Получаем адреса (используем ваш метод raw_to_friendly для красоты)
-                    s_info = details.get("sender", {})
-                    r_info = details.get("recipient", {})
-
-                    from_addr = s_info.get("user_friendly") or s_info.get("name") or self.raw_to_friendly(s_info.get("address"))
-                    to_addr = r_info.get("user_friendly") or r_info.get("name") or self.raw_to_friendly(r_info.get("address"))
-                    
-                    dt = datetime.fromtimestamp(data.get("timestamp", 0)).strftime('%Y-%m-%d %H:%M:%S')
-                    
-                    # Возвращаем словарь для main.py вместо вывода в консоль
-                    return self._format_result(
-                        symbol=symbol,
-                        amount=amount,
-                        from_addr=from_addr,
-                        to_addr=to_addr,
-                        dt=dt
-                    )
+                # Получаем адреса (используем ваш метод raw_to_friendly для красоты)
+                s_info = details.get("sender", {})
+                r_info = details.get("recipient", {})
 
-            return None
-        except Exception as e:
-            return None
+                from_addr = s_info.get("user_friendly") or s_info.get("name") or self.raw_to_friendly(s_info.get("address"))
+                to_addr = r_info.get("user_friendly") or r_info.get("name") or self.raw_to_friendly(r_info.get("address"))
+                
+                dt = datetime.fromtimestamp(data.get("timestamp", 0)).strftime('%Y-%m-%d %H:%M:%S')
+                
+                result = self._format_result(
+                    symbol=symbol,
+                    amount=amount,
+                    from_addr=from_addr,
+                    to_addr=to_addr,
+                    dt=dt
+                )
+                if action_type == "JettonTransfer":
+                    # Адрес мастер-контракта jetton — для проверки подлинности токена во входящих переводах
+                    result["jetton"] = details.get("jetton", {}).get("address")
+                yield r_info.get("address"), result
 
-    def check_doge(self, tx_hash, target_wallet=None):
+    async def check_doge(self, tx_hash, target_wallet=None):
         """Парсинг Dogecoin через Blockchair, возвращает словарь с данными или None"""
         url = f"https://api.blockchair.com/dogecoin/dashboards/transaction/{tx_hash}"
         try:
-            res = requests.get(url, headers=self.headers, timeout=10)
+            res = await self._get(url, headers=self.headers, timeout=10)
             if res.status_code != 200: 
                 return None
             
             data = res.json()["data"].get(tx_hash)
             if not data: 
                 return None
-            
-            tx = data["transaction"]
-            outputs = data.get("outputs", [])
-            
-            found_amount = 0
-            final_to_addr = ""
-
-            if target_wallet:
-                # Считаем сумму только для конкретного кошелька
-                for out in outputs:
-                    if out.get("recipient") == target_wallet:
-                        found_amount += out.get("value", 0)
-                final_to_addr = target_wallet if found_amount > 0 else "Address not found"
-            else:
-                # Если кошелек не задан, берем первый выход
-                found_amount = sum(out.get("value", 0) for out in outputs)
-                final_to_addr = outputs[0].get("recipient") if outputs else "N/A"
-
-            # DOGE имеет 8 знаков после запятой
-            amount_doge = found_amount / 100_000_000 
-            
-            # Если сумма 0 (транзакция есть, но на этот адрес ничего не пришло), возвращаем None
-            if amount_doge <= 0:
-                return None
-
-            from_addr = data.get("inputs", [{}])[0].get("recipient", "N/A")
-            dt = tx.get("time", "N/A")
-
-            # Возвращаем словарь через ваш метод _format_result
-            return self._format_result(
-                symbol="DOGE",
-                amount=amount_doge,
-                from_addr=from_addr,
-                to_addr=final_to_addr,
-                dt=dt
-            )
+            return self._parse_blockchair_doge(data, target_wallet)
+        except ProviderUnavailable:
+            raise
         except Exception as e:
             return None
 
-    def check_eth_erc20(self, tx_hash, target_wallet=None):
-        """Парсинг Ethereum и ERC-20, возвращает словарь с данными или None"""
+    def _parse_blockchair_doge(self, data, target_wallet=None):
+        """Разбор записи dashboards Blockchair для Dogecoin"""
+        tx = data["transaction"]
+        outputs = data.get("outputs", [])
+        
+        found_amount = 0
+        final_to_addr = ""
+
+        if target_wallet:
+            # Считаем сумму только для конкретного кошелька
+            for out in outputs:
+                if same_address(out.get("recipient"), target_wallet):
+                    found_amount += out.get("value", 0)
+            final_to_addr = target_wallet if found_amount > 0 else "Address not found"
+        else:
+            # Если кошелек не задан, берем первый выход
+            found_amount = sum(out.get("value", 0) for out in outputs)
+            final_to_addr = outputs[0].get("recipient") if outputs else "N/A"
+
+        # DOGE имеет 8 знаков после запятой
+        amount_doge = found_amount / 100_000_000 
         
-        # 1. Пробуем Ethplorer (лучше всего для токенов)
-        url_ethplorer = f"https://api.ethplorer.io/getTxInfo/{tx_hash}?apiKey=freekey"
+        # Если сумма 0 (транзакция есть, но на этот адрес ничего не пришло), возвращаем None
+        if amount_doge <= 0:
+            return None
+
+        from_addr = data.get("inputs", [{}])[0].get("recipient", "N/A")
+        dt = tx.get("time", "N/A")
+
+        return self._format_result(
+            symbol="DOGE",
+            amount=amount_doge,
+            from_addr=from_addr,
+            to_addr=final_to_addr,
+            dt=dt
+        )
+
+    async def check_eth_erc20(self, tx_hash, target_wallet=None):
+        """
+        Парсинг Ethereum и ERC-20, возвращает словарь с данными или None.
+        Провайдеры (Ethplorer, Blockchair) опрашиваются в порядке их текущего рейтинга.
+        """
+        providers = {
+            f"https://api.ethplorer.io/getTxInfo/{tx_hash}?apiKey=freekey": self._eth_from_ethplorer,
+            f"https://api.blockchair.com/ethereum/dashboards/transaction/{tx_hash}": self._eth_from_blockchair,
+        }
+        unavailable = 0
+        for url in self.health.rank(providers):
+            try:
+                answered, result = await providers[url](url, tx_hash, target_wallet)
+            except ProviderUnavailable as e:
+                print(f"  [LOG] {e}")
+                unavailable += 1
+                continue
+            if answered:
+                return result
+        if unavailable == len(providers):
+            raise ProviderUnavailable("ethereum: все провайдеры недоступны")
+        return None
+
+    async def _eth_from_ethplorer(self, url, tx_hash, target_wallet=None):
+        """Ethplorer (лучше всего для токенов). Возвращает (провайдер знает транзакцию, результат)"""
         try:
-            res = requests.get(url_ethplorer, timeout=10)
+            res = await self._get(url, timeout=10)
             data = res.json()
             
             if "hash" in data:
-                symbol = "ETH"
-                amount = 0
-                from_addr = data.get("from")
-                to_addr = data.get("to")
-                
-                # Если это перевод токена
-                if "operations" in data and len(data["operations"]) > 0:
-                    op = data["operations"][0]
-                    symbol = op["tokenInfo"]["symbol"]
-                    amount = int(op["value"]) / (10 ** int(op["tokenInfo"]["decimals"]))
-                    from_addr = op["from"]
-                    to_addr = op["to"]
-                else:
-                    # Если это обычный перевод ETH
-                    amount = data.get("value", 0)
-
-                # Если указан кошелек, проверяем, что перевод именно на него
-                if target_wallet and to_addr.lower() != target_wallet.lower():
-                    return None
-                
-                dt = datetime.fromtimestamp(data.get("timestamp")).strftime('%Y-%m-%d %H:%M:%S')
-                
-                return self._format_result(symbol, amount, from_addr, to_addr, dt)
+                return True, self._parse_ethplorer(data, target_wallet)
+        except ProviderUnavailable:
+            raise
         except Exception as e:
             print(f"  [LOG] Ethplorer Error")
+        return False, None
+
+    def _parse_ethplorer(self, data, target_wallet=None):
+        """Разбор ответа Ethplorer getTxInfo (перевод ETH или первый перевод токена)"""
+        symbol = "ETH"
+        amount = 0
+        from_addr = data.get("from")
+        to_addr = data.get("to")
+        
+        # Если это перевод токена
+        if "operations" in data and len(data["operations"]) > 0:
+            op = data["operations"][0]
+            symbol = op["tokenInfo"]["symbol"]
+            amount = int(op["value"]) / (10 ** int(op["tokenInfo"]["decimals"]))
+            from_addr = op["from"]
+            to_addr = op["to"]
+        else:
+            # Если это обычный перевод ETH
+            amount = data.get("value", 0)
+
+        # Если указан кошелек, проверяем, что перевод именно на него
+        if target_wallet and not same_address(to_addr, target_wallet):
+            return None
+        
+        dt = datetime.fromtimestamp(data.get("timestamp")).strftime('%Y-%m-%d %H:%M:%S')
+        
+        return self._format_result(symbol, amount, from_addr, to_addr, dt)
 
-        # 2. Резерв: Пробуем Blockchair
-        url_bc = f"https://api.blockchair.com/ethereum/dashboards/transaction/{tx_hash}"
+    async def _eth_from_blockchair(self, url, tx_hash, target_wallet=None):
+        """Резерв: Blockchair. Возвращает (провайдер знает транзакцию, результат)"""
         try:
-            res = requests.get(url_bc, headers=self.headers, timeout=10)
+            res = await self._get(url, headers=self.headers, timeout=10)
             if res.status_code == 200:
                 data = res.json()["data"][tx_hash]
                 tx = data["transaction"]
                 
                 # Проверка для ETH
                 to_addr = tx.get("recipient")
-                if target_wallet and to_addr.lower() != target_wallet.lower():
-                    return None
+                if target_wallet and not same_address(to_addr, target_wallet):
+                    return True, None
                 
-                return self._format_result(
+                return True, self._format_result(
                     symbol="ETH",
                     amount=int(tx["value"]) / 10**18,
                     from_addr=tx.get("sender"),
                     to_addr=to_addr,
                     dt=tx.get("time")
                 )
+        except ProviderUnavailable:
+            raise
         except Exception as e:
             print(f"  [LOG] Blockchair ETH Error:")
             
-        return None
+        return False, None
 
-    def check_evm_universal(self, tx_hash, network="base", target_wallet=None):
+    async def check_evm_universal(self, tx_hash, network="base", target_wallet=None):
         """
         Универсальный поиск для EVM сетей через Blockchair.
         network: 'base', 'arbitrum', 'ethereum', 'polygon', 'binance-smart-chain' и т.д.
         """
         url = f"https://api.blockchair.com/{network}/dashboards/transaction/{tx_hash}"
         try:
-            res = requests.get(url, headers=self.headers, timeout=10)
+            res = await self._get(url, headers=self.headers, timeout=10)
             if res.status_code != 200: 
                 return None
             
-            data = res.json()["data"][tx_hash]
-            tx = data["transaction"]
-            
-            # Инициализация переменных
-            symbol = "ETH"
-            amount = 0
-            to_addr = tx.get("recipient")
-            from_addr = tx.get("sender")
-            dt = tx.get("time")
-
-            # 1. Проверка на ERC-20 токены
-            if data.get("layer_2") and "erc_20" in data["layer_2"] and data["layer_2"]["erc_20"]:
-                token = data["layer_2"]["erc_20"][0]
-                symbol = token["token_symbol"]
-                amount = int(token["value"]) / (10 ** token["token_decimals"])
-                to_addr = token["recipient"]
-            else:
-                # 2. Обычный перевод нативной валюты (ETH, BNB, MATIC и т.д.)
-                amount = int(tx["value"]) / 10**18
-                symbol = network.upper()
-
-            # Проверка, что транзакция была именно на наш целевой кошелек
-            if target_wallet and to_addr.lower() != target_wallet.lower():
-                return None
-
-            # Если сумма 0 (например, просто вызов контракта без перевода), возвращаем None
-            if amount <= 0:
+            data = res.json()["data"].get(tx_hash)
+            if not data:
                 return None
-
-            return self._format_result(
-                symbol=symbol,
-                amount=amount,
-                from_addr=from_addr,
-                to_addr=to_addr,
-                dt=dt
-            )
+            return self._parse_blockchair_evm(data, network, target_wallet)
+        except ProviderUnavailable:
+            raise
         except Exception as e:
             return None
 
-    def check_base(self, tx_hash, target_wallet=None):
-        """Парсинг сети BASE через Blockchair, возвращает словарь с данными или None"""
-        url = f"https://api.blockchair.com/base/dashboards/transaction/{tx_hash}"
+    def _parse_blockchair_evm(self, data, network, target_wallet=None):
+        """Разбор записи dashboards Blockchair для EVM сети (нативный перевод или ERC-20/BEP-20)"""
+        tx = data["transaction"]
         
-        try:
-            res = requests.get(url, headers=self.headers, timeout=10)
-            if res.status_code != 200:
-                return None
-            
-            data = res.json()["data"].get(tx_hash)
-            if not data:
-                return None
-            
-            tx = data["transaction"]
-            
-            # Инициализация переменных
-            symbol = "ETH (Base)"
-            amount = 0
-            to_addr = tx.get("recipient")
-            from_addr = tx.get("sender")
-            dt = tx.get("time")
-
-            # 1. Проверка на токены (ERC-20)
-            if data.get("layer_2") and "erc_20" in data["layer_2"] and data["layer_2"]["erc_20"]:
-                token = data["layer_2"]["erc_20"][0]
-                symbol = token["token_symbol"]
-                amount = int(token["value"]) / (10 ** token["token_decimals"])
-                to_addr = token["recipient"]
-            else:
-                # 2. Нативный перевод ETH в сети Base
-                amount = int(tx["value"]) / 10**18
-
-            # Безопасность: сверяем кошелек получателя
-            if target_wallet and to_addr.lower() != target_wallet.lower():
-                return None
-            
-            # Проверка на нулевую транзакцию
-            if amount <= 0:
-                return None
+        # Инициализация переменных
+        symbol = NATIVE_SYMBOLS.get(network, network.upper())
+        amount = 0
+        to_addr = tx.get("recipient")
+        from_addr = tx.get("sender")
+        dt = tx.get("time")
+
+        # 1. Проверка на ERC-20 токены
+        if data.get("layer_2") and "erc_20" in data["layer_2"] and data["layer_2"]["erc_20"]:
+            token = data["layer_2"]["erc_20"][0]
+            symbol = token["token_symbol"]
+            amount = int(token["value"]) / (10 ** token["token_decimals"])
+            to_addr = token["recipient"]
+        else:
+            # 2. Обычный перевод нативной валюты (ETH, BNB, MATIC и т.д.)
+            amount = int(tx["value"]) / 10**18
+
+        # Проверка, что транзакция была именно на наш целевой кошелек
+        if target_wallet and not same_address(to_addr, target_wallet):
+            return None
 
-            return self._format_result(
-                symbol=symbol,
-                amount=amount,
-                from_addr=from_addr,
-                to_addr=to_addr,
-                dt=dt
-            )
-        except Exception as e:
+        # Если сумма 0 (например, просто вызов контракта без перевода), возвращаем None
+        if amount <= 0:
             return None
 
-    def check_bsc(self, tx_hash, target_wallet=None):
-        """Парсинг сети BSC (BNB Smart Chain) через Blockchair"""
-        url = f"https://api.blockchair.com/binance-smart-chain/dashboards/transaction/{tx_hash}"
-        try:
-            res = requests.get(url, headers=self.headers, timeout=10)
-            if res.status_code != 200:
-                return None
-            
-            data = res.json()["data"].get(tx_hash)
-            if not data:
-                return None
-            
-            tx = data["transaction"]
-            
-            # Инициализация переменных
-            symbol = "BNB"
-            amount = 0
-            to_addr = tx.get("recipient")
-            from_addr = tx.get("sender")
-            dt = tx.get("time")
-
-            # 1. Проверка на токены BEP-20
-            if data.get("layer_2") and "erc_20" in data["layer_2"] and data["layer_2"]["erc_20"]:
-                token = data["layer_2"]["erc_20"][0]
-                symbol = token["token_symbol"]
-                amount = int(token["value"]) / (10 ** token["token_decimals"])
-                to_addr = token["recipient"]
-            else:
-                # 2. Нативный перевод BNB
-                amount = int(tx["value"]) / 10**18
-
-            # Безопасность: сверяем кошелек получателя (регистр не важен)
-            if target_wallet and to_addr.lower() != target_wallet.lower():
-                return None
-            
-            # Проверка на пустую транзакцию
-            if amount <= 0:
-                return None
+        return self._format_result(
+            symbol=symbol,
+            amount=amount,
+            from_addr=from_addr,
+            to_addr=to_addr,
+            dt=dt
+        )
 
-            return self._format_result(
-                symbol=symbol,
-                amount=amount,
-                from_addr=from_addr,
-                to_addr=to_addr,
-                dt=dt
-            )
-        except Exception as e:
-            return None
+    async def check_base(self, tx_hash, target_wallet=None):
+        """Парсинг сети BASE через Blockchair, возвращает словарь с данными или None"""
+        return await self.check_evm_universal(tx_hash, "base", target_wallet)
+
+    async def check_bsc(self, tx_hash, target_wallet=None):
+        """Парсинг сети BSC (BNB Smart Chain) через Blockchair"""
+        return await self.check_evm_universal(tx_hash, "binance-smart-chain", target_wallet)
 
-    def check_xmr(self, tx_hash, target_wallet=None):
+    async def check_xmr(self, tx_hash, target_wallet=None):
         """
         Проверка Monero через публичные API.
         ВНИМАНИЕ: Сумма и адреса в XMR скрыты, возвращаем "HIDDEN".
         """
-        import urllib3
-        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-        
-        # Список доступных API для Monero
+        # Список доступных API для Monero (Monero.ovh, XMRScan), лучший по рейтингу — первым
         providers = [
-            {"name": "Monero.ovh", "url": f"https://explorer.monero.ovh/api/transaction/{tx_hash}"},
-            {"name": "XMRScan", "url": f"https://xmrscan.org/api/v1/tx/{tx_hash}"}
+            f"https://explorer.monero.ovh/api/transaction/{tx_hash}",
+            f"https://xmrscan.org/api/v1/tx/{tx_hash}",
         ]
         
         headers = {"User-Agent": "Mozilla/5.0", "Accept": "application/json"}
+        unavailable = 0
         
-        for api in providers:
+        for url in self.health.rank(providers):
             try:
-                res = requests.get(api["url"], headers=headers, timeout=15, verify=False)
+                res = await self._get(url, headers=headers, timeout=15)
                 
                 if res.status_code == 200:
-                    data = res.json()
-                    # У разных API разная структура ответа
-                    tx_data = data.get("data", {})
-                    if not tx_data: continue
-                    
-                    timestamp = tx_data.get("timestamp")
-                    if timestamp:
-                        dt = datetime.fromtimestamp(int(timestamp)).strftime('%Y-%m-%d %H:%M:%S')
-                        
-                        # Возвращаем данные. 
-                        # Так как XMR конфиденциален, для суммы и адресов ставим заглушки
-                        return self._format_result(
-                            symbol="XMR",
-                            amount=0.0, # Невозможно определить публично
-                            from_addr="CONFIDENTIAL",
-                            to_addr="CONFIDENTIAL",
-                            dt=dt
-                        )
+                    result = self._parse_xmr(res.json())
+                    if result:
+                        return result
+            except ProviderUnavailable as e:
+                print(f"  [LOG] {e}")
+                unavailable += 1
             except Exception as e:
                 continue
 
+        if unavailable == len(providers):
+            raise ProviderUnavailable("monero: все провайдеры недоступны")
         return None
 
-    def check_tron(self, tx_hash, target_wallet=None):
+    def _parse_xmr(self, data):
+        """Разбор ответа API Monero: только факт и время транзакции"""
+        # У разных API разная структура ответа
+        tx_data = data.get("data", {})
+        if not tx_data:
+            return None
+        
+        timestamp = tx_data.get("timestamp")
+        if not timestamp:
+            return None
+        dt = datetime.fromtimestamp(int(timestamp)).strftime('%Y-%m-%d %H:%M:%S')
+        
+        # Так как XMR конфиденциален, для суммы и адресов ставим заглушки
+        return self._format_result(
+            symbol="XMR",
+            amount=0.0, # Невозможно определить публично
+            from_addr="CONFIDENTIAL",
+            to_addr="CONFIDENTIAL",
+            dt=dt
+        )
+
+    async def check_tron(self, tx_hash, target_wallet=None):
         """Парсинг сети TRON, возвращает словарь с данными или None"""
         url = f"https://apilist.tronscan.org/api/transaction-info?hash={tx_hash}"
         try:
-            res = requests.get(url, headers=self.headers, timeout=10)
+            res = await self._get(url, headers=self.headers, timeout=10)
             if res.status_code != 200: return None
-            data = res.json()
-            
-            if "hash" not in data: return None
-
-            symbol = "TRX"
-            amount = 0
-            # Извлекаем адреса из корня или contractData
-            from_addr = data.get("ownerAddress") or data.get("fromAddress", "N/A")
-            to_addr = data.get("toAddress") or data.get("contractData", {}).get("to_address", "N/A")
-
-            # 1. Проверка на TRC-20 токены (USDT, USDC и т.д.)
-            if data.get("trc20TransferInfo"):
-                ti = data["trc20TransferInfo"][0]
-                symbol = ti.get("symbol", "TOKEN")
-                decimals = int(ti.get("decimals", 6))
-                amount = int(ti.get("amount_str", 0)) / (10 ** decimals)
-                to_addr = ti.get("to_address")
-                from_addr = ti.get("from_address")
-            
-            # 2. Проверка на нативный TRX
-            else:
-                c_data = data.get("contractData", {})
-                if isinstance(c_data, dict) and "amount" in c_data:
-                    amount = int(c_data["amount"]) / 1_000_000
-                elif data.get("amount"):
-                    amount = int(data.get("amount", 0)) / 1_000_000
-
-            # Безопасность: сверяем кошелек получателя
-            # В TRON адреса обычно имеют разный формат (T... или 41...), 
-            # но Tronscan отдает их в стандарте T...
-            if target_wallet and to_addr != target_wallet:
-                # Если адреса разные, транзакция нам не подходит
-                return None
+            return self._parse_tron(res.json(), target_wallet)
+        except ProviderUnavailable:
+            raise
+        except Exception as e:
+            return None
 
-            if amount <= 0: return None
+    def _parse_tron(self, data, target_wallet=None):
+        """Разбор ответа Tronscan transaction-info (TRC-20 или нативный TRX)"""
+        if "hash" not in data: return None
+
+        symbol = "TRX"
+        amount = 0
+        # Извлекаем адреса из корня или contractData
+        from_addr = data.get("ownerAddress") or data.get("fromAddress", "N/A")
+        to_addr = data.get("toAddress") or data.get("contractData", {}).get("to_address", "N/A")
+
+        # 1. Проверка на TRC-20 токены (USDT, USDC и т.д.)
+        if data.get("trc20TransferInfo"):
+            ti = data["trc20TransferInfo"][0]
+            symbol = ti.get("symbol", "TOKEN")
+            decimals = int(ti.get("decimals", 6))
+            amount = int(ti.get("amount_str", 0)) / (10 ** decimals)
+            to_addr = ti.get("to_address")
+            from_addr = ti.get("from_address")
+        
+        # 2. Проверка на нативный TRX
+        else:
+            c_data = data.get("contractData", {})
+            if isinstance(c_data, dict) and "amount" in c_data:
+                amount = int(c_data["amount"]) / 1_000_000
+            elif data.get("amount"):
+                amount = int(data.get("amount", 0)) / 1_000_000
+
+        # Безопасность: сверяем кошелек получателя
+        # В TRON адреса бывают в формате T... или 41..., сравниваем канонические формы
+        if target_wallet and not same_address(to_addr, target_wallet):
+            # Если адреса разные, транзакция нам не подходит
+            return None
 
-            # Преобразование времени (в TRON в миллисекундах)
-            timestamp = data.get("timestamp", 0)
-            dt = datetime.fromtimestamp(timestamp / 1000).strftime('%Y-%m-%d %H:%M:%S')
+        if amount <= 0: return None
 
-            return self._format_result(
-                symbol=symbol,
-                amount=amount,
-                from_addr=from_addr,
-                to_addr=to_addr,
-                dt=dt
-            )
-        except Exception as e:
-            return None
+        # Преобразование времени (в TRON в миллисекундах)
+        timestamp = data.get("timestamp", 0)
+        dt = datetime.fromtimestamp(timestamp / 1000).strftime('%Y-%m-%d %H:%M:%S')
 
-    def check_bitcoin(self, tx_hash, target_wallet=None):
+        return self._format_result(
+            symbol=symbol,
+            amount=amount,
+            from_addr=from_addr,
+            to_addr=to_addr,
+            dt=dt
+        )
+
+    async def check_bitcoin(self, tx_hash, target_wallet=None):
         """Парсинг Bitcoin через Blockchain.info, возвращает словарь с данными или None"""
         url = f"https://blockchain.info/rawtx/{tx_hash}"
         try:
-            res = requests.get(url, timeout=10)
+            res = await self._get(url, timeout=10)
             if res.status_code != 200:
                 return None
             
-            data = res.json()
-            outputs = data.get('out', [])
-            inputs = data.get('inputs', [])
-            
-            # Если кошелек указан, ищем сумму только для него
-            if target_wallet:
-                found_amount = sum(out.get('value', 0) for out in outputs if out.get('addr') == target_wallet)
-                to_addr = target_wallet
-            else:
-                # Если кошелек не указан, берем общую сумму всех выходов
-                found_amount = sum(out.get('value', 0) for out in outputs)
-                to_addr = outputs[0].get('addr') if outputs else "N/A"
-
-            # BTC имеет 8 знаков после запятой (1 satoshi = 0.00000001 BTC)
-            amount_btc = found_amount / 10**8
-            
-            # Если сумма 0 (транзакция есть, но на наш кошелек не пришло ничего), возвращаем None
-            if amount_btc <= 0:
-                return None
-
-            from_addr = inputs[0].get('prev_out', {}).get('addr', "N/A") if inputs else "N/A"
-            dt = datetime.fromtimestamp(data.get("time")).strftime('%Y-%m-%d %H:%M:%S')
-
-            return self._format_result(
-                symbol="BTC",
-                amount=amount_btc,
-                from_addr=from_addr,
-                to_addr=to_addr,
-                dt=dt
-            )
+            return self._parse_bitcoin(res.json(), target_wallet)
+        except ProviderUnavailable:
+            raise
         except Exception as e:
             return None
+
+    def _parse_bitcoin(self, data, target_wallet=None):
+        """Разбор ответа Blockchain.info rawtx"""
+        outputs = data.get('out', [])
+        inputs = data.get('inputs', [])
+        
+        # Если кошелек указан, ищем сумму только для него
+        if target_wallet:
+            found_amount = sum(out.get('value', 0) for out in outputs if same_address(out.get('addr'), target_wallet))
+            to_addr = target_wallet
+        else:
+            # Если кошелек не указан, берем общую сумму всех выходов
+            found_amount = sum(out.get('value', 0) for out in outputs)
+            to_addr = outputs[0].get('addr') if outputs else "N/A"
+
+        # BTC имеет 8 знаков после запятой (1 satoshi = 0.00000001 BTC)
+        amount_btc = found_amount / 10**8
+        
+        # Если сумма 0 (транзакция есть, но на наш кошелек не пришло ничего), возвращаем None
+        if amount_btc <= 0:
+            return None
+
+        from_addr = inputs[0].get('prev_out', {}).get('addr', "N/A") if inputs else "N/A"
+        dt = datetime.fromtimestamp(data.get("time")).strftime('%Y-%m-%d %H:%M:%S')
+
+        return self._format_result(
+            symbol="BTC",
+            amount=amount_btc,
+            from_addr=from_addr,
+            to_addr=to_addr,
+            dt=dt
+        )
+
+    # --- Входящие переводы на адрес (используется services.wallet_watcher) ---
+
+    async def incoming_transfers(self, wallet, since_ts):
+        """
+        Возвращает входящие переводы на кошелек не раньше since_ts (unix, сек.), от старых к новым.
+        Каждый перевод — словарь _format_result с дополнительными полями tx_hash и ts.
+        Переводы токенов — только контрактов из TOKEN_CONTRACTS, символ берется из него, а не от провайдера.
+        Поддерживаются TRON, TON, Bitcoin и Ethereum; для остальных сетей возвращает пустой список.
+        Недоступность провайдера пробрасывается (ProviderUnavailable), чтобы курсор не сдвигался.
+        """
+        chains = chains_for_wallet(wallet)
+        fetchers = []
+        if "tron" in chains:
+            fetchers += [self._tron_incoming_trc20, self._tron_incoming_native]
+        if "ton" in chains:
+            fetchers.append(self._ton_incoming)
+        if "bitcoin" in chains:
+            fetchers.append(self._bitcoin_incoming)
+        if "ethereum" in chains:
+            fetchers += [self._eth_incoming_tokens, self._eth_incoming_native]
+
+        batches = await asyncio.gather(*(fetch(wallet, since_ts) for fetch in fetchers))
+        return sorted((t for batch in batches for t in batch), key=lambda t: t["ts"])
+
+    def _transfer(self, tx_hash, ts, symbol, amount, from_addr, to_addr):
+        res = self._format_result(
+            symbol=symbol,
+            amount=amount,
+            from_addr=from_addr,
+            to_addr=to_addr,
+            dt=datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
+        )
+        res.update(tx_hash=tx_hash, ts=ts)
+        return res
+
+    def _known_token(self, chain, contract):
+        """Символ токена по адресу контракта из TOKEN_CONTRACTS или None для неизвестного токена"""
+        return next((symbol for address, symbol in TOKEN_CONTRACTS.get(chain, {}).items() if same_address(address, contract)), None)
+
+    async def _tron_incoming_trc20(self, wallet, since_ts):
+        url = (f"https://apilist.tronscan.org/api/token_trc20/transfers?limit=50&start=0&sort=-timestamp"
+               f"&toAddress={tron_base58(wallet)}&start_timestamp={int(since_ts * 1000)}")
+        res = await self._get(url, headers=self.headers, timeout=10)
+        if res.status_code != 200: return []
+        transfers = []
+        for t in res.json().get("token_transfers", []):
+            if not same_address(t.get("to_address"), wallet): continue
+            info = t.get("tokenInfo", {})
+            symbol = self._known_token("tron", t.get("contract_address") or info.get("tokenId"))
+            if symbol is None: continue
+            amount = int(t.get("quant", 0)) / 10 ** int(info.get("tokenDecimal", 6))
+            transfers.append(self._transfer(
+                t["transaction_id"], t.get("block_ts", 0) / 1000,
+                symbol, amount, t.get("from_address"), wallet
+            ))
+        return transfers
+
+    async def _tron_incoming_native(self, wallet, since_ts):
+        # /api/transfer отдает и TRC10 токены, которые может выпустить кто угодно под любым именем ("USDT"):
+        # запрашиваем и принимаем только TRX (tokenId "_"), символ и 6 знаков не берем из ответа провайдера
+        url = (f"https://apilist.tronscan.org/api/transfer?limit=50&start=0&sort=-timestamp&tokens=_"
+               f"&toAddress={tron_base58(wallet)}&start_timestamp={int(since_ts * 1000)}")
+        res = await self._get(url, headers=self.headers, timeout=10)
+        if res.status_code != 200: return []
+        transfers = []
+        for t in res.json().get("data", []):
+            if not same_address(t.get("transferToAddress"), wallet): continue
+            if (t.get("tokenInfo") or {}).get("tokenId", t.get("tokenName")) != "_": continue
+            amount = int(t.get("amount", 0)) / 10**6
+            transfers.append(self._transfer(
+                t["transactionHash"], t.get("timestamp", 0) / 1000,
+                "TRX", amount, t.get("transferFromAddress"), wallet
+            ))
+        return transfers
+
+    async def _ton_incoming(self, wallet, since_ts):
+        url = f"https://tonapi.io/v2/accounts/{wallet}/events?limit=50&start_date={int(since_ts)}"
+        res = await self._get(url, headers=self.headers, timeout=15)
+        if res.status_code != 200: return []
+        transfers = []
+        for event in res.json().get("events", []):
+            for recipient, result in self._ton_transfers(event):
+                if not same_address(recipient, wallet):
+                    continue
+                if "jetton" in result:
+                    symbol = self._known_token("ton", result.pop("jetton"))
+                    if symbol is None:
+                        continue
+                    result["symbol"] = symbol
+                result.update(tx_hash=event["event_id"], ts=event.get("timestamp", 0))
+                transfers.append(result)
+        return transfers
+
+    async def _bitcoin_incoming(self, wallet, since_ts):
+        res = await self._get(f"https://blockchain.info/rawaddr/{wallet}?limit=50", timeout=10)
+        if res.status_code != 200: return []
+        transfers = []
+        for tx in res.json().get("txs", []):
+            if tx.get("time", 0) < since_ts: continue
+            inputs = tx.get("inputs", [])
+            # Сдача на собственный адрес — не входящий платеж
+            if any(same_address(i.get("prev_out", {}).get("addr"), wallet) for i in inputs): continue
+            found_amount = sum(out.get("value", 0) for out in tx.get("out", []) if same_address(out.get("addr"), wallet))
+            if found_amount <= 0: continue
+            from_addr = inputs[0].get("prev_out", {}).get("addr", "N/A") if inputs else "N/A"
+            transfers.append(self._transfer(tx["hash"], tx["time"], "BTC", found_amount / 10**8, from_addr, wallet))
+        return transfers
+
+    async def _eth_incoming_tokens(self, wallet, since_ts):
+        url = f"https://api.ethplorer.io/getAddressHistory/{wallet}?apiKey=freekey&type=transfer&limit=50"
+        res = await self._get(url, timeout=10)
+        if res.status_code != 200: return []
+        transfers = []
+        for op in res.json().get("operations", []):
+            if op.get("timestamp", 0) < since_ts or not same_address(op.get("to"), wallet): continue
+            info = op.get("tokenInfo", {})
+            symbol = self._known_token("ethereum", info.get("address"))
+            if symbol is None: continue
+            amount = int(op.get("value", 0)) / 10 ** int(info.get("decimals", 18))
+            transfers.append(self._transfer(
+                op["transactionHash"], op["timestamp"], symbol, amount, op.get("from"), op.get("to")
+            ))
+        return transfers
+
+    async def _eth_incoming_native(self, wallet, since_ts):
+        url = f"https://api.ethplorer.io/getAddressTransactions/{wallet}?apiKey=freekey&limit=50"
+        res = await self._get(url, timeout=10)
+        if res.status_code != 200: return []
+        data = res.json()
+        if not isinstance(data, list): return []
+        transfers = []
+        for tx in data:
+            if tx.get("timestamp", 0) < since_ts or not tx.get("success", True): continue
+            if not same_address(tx.get("to"), wallet) or not tx.get("value"): continue
+            transfers.append(self._transfer(tx["hash"], tx["timestamp"], "ETH", tx["value"], tx.get("from"), tx.get("to")))
+        return transfers
@@ -0,0 +1,152 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from datetime import datetime
+from core.config import settings
+from aiogram.exceptions import TelegramRetryAfter
+from core.constants import OPERATORS_TO_GROUPS
+from db.repository import get_queued_tasks, assign_task_to_operator, return_task_to_queue
+from services.bot_service import BotService
+from services.operator_logic import balancer
+from services.operator_state import operator_registry
+
+log = logging.getLogger(__name__)
+
+VISIT_TIME_FORMATS = ("%d.%m.%Y %H:%M", "%d.%m.%Y %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S")
+
+
+def parse_visit_time(value):
+    """Время визита по сделке (datetime_meeting) или None, если его нет или формат не распознан"""
+    if isinstance(value, datetime):
+        return value
+    if not value:
+        return None
+    value = str(value).strip()
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        pass
+    for fmt in VISIT_TIME_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def task_priority(task) -> tuple:
+    """Сначала задачи с более ранним визитом, задачи без времени визита — после них; дальше по возрасту"""
+    visit = parse_visit_time(task.get('datetime_meeting'))
+    return (visit is None, visit or datetime.min, task.get('assigned_at') or datetime.min, task['id'])
+
+
+class PendingDispatcher:
+    """
+    Раздача общей очереди (operator_id = 'queue').
+    Держит в памяти кучу задач в порядке task_priority и назначает их, как только освобождается
+    любой оператор: при старте, выходе онлайн, паузе и завершении задачи. Раз в DISPATCH_RESYNC_INTERVAL
+    очередь перечитывается из БД. Задача, которую не удалось доставить оператору (ошибка Telegram),
+    возвращается в очередь, раздача повторяется после паузы.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.queued = set()
+        self.counter = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+    async def start(self):
+        await self.load()
+        operator_registry.on_online.append(lambda op_id: self.kick())
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+            log.info("PendingDispatcher started")
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    def kick(self):
+        """Сигнал, что какой-то оператор мог освободиться"""
+        self.wakeup.set()
+
+    async def load(self):
+        self.heap, self.queued = [], set()
+        for task in await get_queued_tasks():
+            self._push(task)
+        self.kick()
+
+    def _push(self, task):
+        if task['id'] in self.queued:
+            return
+        self.queued.add(task['id'])
+        heapq.heappush(self.heap, (task_priority(task), next(self.counter), task))
+
+    async def enqueue(self, task_id):
+        """Ставит новую задачу из очереди в кучу и сразу пробует ее раздать"""
+        for task in await get_queued_tasks(task_id):
+            self._push(task)
+        self.kick()
+
+    async def _run(self):
+        resync_at = asyncio.get_running_loop().time() + settings.DISPATCH_RESYNC_INTERVAL
+        while True:
+            timeout = max(resync_at - asyncio.get_running_loop().time(), 0)
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            try:
+                if asyncio.get_running_loop().time() >= resync_at:
+                    resync_at = asyncio.get_running_loop().time() + settings.DISPATCH_RESYNC_INTERVAL
+                    await self.load()
+                await self.dispatch()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error(f"PendingDispatcher error: {e}", exc_info=True)
+
+    async def dispatch(self):
+        """Раздает задачи по одной каждому свободному оператору, пока есть и задачи, и операторы"""
+        while self.heap:
+            async with balancer.lock.hold():
+                # Назначенные, но еще не принятые задачи занимают емкость оператора,
+                # иначе вся очередь уйдет первому свободному
+                free = await balancer.free_operators(count_assigned=True)
+                op_id = next((str(op['personal_telegram_id']) for op in free if OPERATORS_TO_GROUPS.get(str(op['personal_telegram_id']))), None)
+                if op_id is None:
+                    return
+                _, _, task = heapq.heappop(self.heap)
+                self.queued.discard(task['id'])
+                # Задачу мог уже забрать другой воркер
+                if not await assign_task_to_operator(task['id'], op_id):
+                    continue
+                operator_registry.on_assign(op_id, task['id'])
+
+            log.info(f"PendingDispatcher: задача #{task['id']} из очереди назначена оператору {op_id}")
+            try:
+                await BotService.deliver_task(
+                    task['id'], op_id, OPERATORS_TO_GROUPS[op_id], task['chat_id'], task['message_thread_id']
+                )
+            except Exception as e:
+                log.error(f"PendingDispatcher: не удалось доставить задачу #{task['id']} оператору {op_id}: {e}")
+                await self.requeue(task, op_id)
+                delay = e.retry_after if isinstance(e, TelegramRetryAfter) else settings.DISPATCH_RETRY_DELAY
+                asyncio.get_running_loop().call_later(delay, self.kick)
+                return
+
+    async def requeue(self, task, op_id):
+        """Снимает недоставленную задачу с оператора и возвращает ее в кучу"""
+        async with balancer.lock.hold():
+            returned = await return_task_to_queue(task['id'], op_id)
+            operator_registry.on_unassign(op_id, task['id'])
+        if returned:
+            self._push(task)
+
+
+dispatcher = PendingDispatcher()
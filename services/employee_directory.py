@@ -0,0 +1,123 @@
+import asyncio
+import logging
+from core.config import settings
+from db.repository import get_all_employees, get_employees_updated_since, get_employee_by_id, get_online_managers
+
+log = logging.getLogger(__name__)
+
+
+def employee_key(employee_id):
+    """Ключ by_id: id приходит и числом, и строкой (TransactionData.creator_id). None — не число"""
+    try:
+        return int(employee_id)
+    except (TypeError, ValueError):
+        return None
+
+
+class EmployeeDirectory:
+    """
+    Сотрудники в памяти с индексами по id, personal_telegram_id и (role, status).
+    Загружается при старте; раз в EMPLOYEE_REFRESH_INTERVAL дочитывает строки с updated_at не раньше
+    последней виденной метки (если колонки updated_at нет — перезагружается целиком).
+    Удаления видны только после полной перезагрузки: invalidate() без аргументов.
+    """
+
+    def __init__(self):
+        self.by_id = {}
+        self.by_tg = {}
+        self.by_role_status = {}  # (role, status) -> {id: row}
+        self.watermark = None
+        self.has_updated_at = False
+        self.loaded = False
+        self.task = None
+
+    async def start(self):
+        await self.reload()
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.EMPLOYEE_REFRESH_INTERVAL)
+            try:
+                await self.refresh()
+            except Exception as e:
+                log.error(f"EmployeeDirectory refresh error: {e}", exc_info=True)
+
+    async def reload(self):
+        rows = await get_all_employees()
+        self.by_id, self.by_tg, self.by_role_status = {}, {}, {}
+        self.has_updated_at = bool(rows) and "updated_at" in rows[0]
+        self.watermark = None
+        for row in rows:
+            self._put(row)
+        self.loaded = True
+
+    async def refresh(self):
+        if not self.has_updated_at or self.watermark is None:
+            await self.reload()
+            return
+        for row in await get_employees_updated_since(self.watermark):
+            self._put(row)
+
+    async def invalidate(self, employee_id: int = None):
+        """Перечитывает одного сотрудника или, без аргумента, весь справочник"""
+        if employee_id is None:
+            await self.reload()
+            return
+        row = await get_employee_by_id(employee_id)
+        if row:
+            self._put(row)
+        else:
+            self._remove(employee_id)
+
+    def _put(self, row):
+        key = employee_key(row['id'])
+        self._remove(row['id'])
+        self.by_id[key] = row
+        if row.get('personal_telegram_id') is not None:
+            self.by_tg[str(row['personal_telegram_id']).strip()] = row
+        self.by_role_status.setdefault((row.get('role'), row.get('status')), {})[key] = row
+        updated_at = row.get('updated_at')
+        if updated_at is not None and (self.watermark is None or updated_at > self.watermark):
+            self.watermark = updated_at
+
+    def _remove(self, employee_id):
+        employee_id = employee_key(employee_id)
+        old = self.by_id.pop(employee_id, None)
+        if old is None:
+            return
+        if old.get('personal_telegram_id') is not None:
+            self.by_tg.pop(str(old['personal_telegram_id']).strip(), None)
+        self.by_role_status.get((old.get('role'), old.get('status')), {}).pop(employee_id, None)
+
+    # --- Запросы ---
+
+    async def get(self, employee_id):
+        """Данные сотрудника по id (как get_employee_by_id)"""
+        if not self.loaded:
+            return await get_employee_by_id(employee_id)
+        row = self.by_id.get(employee_key(employee_id))
+        return dict(row) if row else None
+
+    def get_by_telegram_id(self, personal_telegram_id):
+        row = self.by_tg.get(str(personal_telegram_id).strip())
+        return dict(row) if row else None
+
+    def with_role(self, role: str, status: str = "online"):
+        return [dict(row) for row in self.by_role_status.get((role, status), {}).values()]
+
+    async def online_managers(self):
+        """Онлайн менеджеры (как get_online_managers)"""
+        if not self.loaded:
+            return await get_online_managers()
+        return self.with_role("Manager")
+
+
+employee_directory = EmployeeDirectory()
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+from urllib.parse import urlsplit
+import httpx
+from core.config import settings
+
+log = logging.getLogger(__name__)
+
+# Хосты блокчейн-провайдеров, для которых клиенты создаются при старте приложения.
+# verify=False — для эксплореров Monero с самоподписанными сертификатами.
+PROVIDER_HOSTS = {
+    "api.blockchair.com": {},
+    "api.ethplorer.io": {},
+    "tonapi.io": {},
+    "apilist.tronscan.org": {},
+    "blockchain.info": {},
+    "explorer.monero.ovh": {"verify": False},
+    "xmrscan.org": {"verify": False},
+}
+
+
+def http2_available():
+    """HTTP/2 в httpx работает только при установленном пакете h2 (pip install httpx[http2])"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class ProviderHttpPool:
+    """Долгоживущие keep-alive клиенты httpx, по одному на хост провайдера"""
+
+    def __init__(self):
+        self.clients = {}
+        # Подменный транспорт httpx (например, воспроизведение записанных ответов в benchmarks)
+        self.transport = None
+
+    def _create_client(self, host):
+        options = PROVIDER_HOSTS.get(host, {})
+        limits = httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS_PER_HOST,
+            max_keepalive_connections=settings.HTTP_MAX_CONNECTIONS_PER_HOST,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+        )
+        return httpx.AsyncClient(
+            limits=limits,
+            http2=settings.HTTP2_ENABLED and http2_available(),
+            verify=options.get("verify", True),
+            timeout=10,
+            transport=self.transport,
+        )
+
+    def client_for(self, url):
+        """Возвращает клиент для хоста из url (создает при первом обращении к неизвестному хосту)"""
+        host = urlsplit(url).hostname
+        client = self.clients.get(host)
+        if client is None:
+            client = self.clients[host] = self._create_client(host)
+        return client
+
+    async def start(self):
+        """Создает клиенты для всех провайдеров и, если включено, прогревает соединения"""
+        for host in PROVIDER_HOSTS:
+            if host not in self.clients:
+                self.clients[host] = self._create_client(host)
+        if settings.HTTP_PREWARM:
+            await self.warmup()
+
+    async def warmup(self):
+        """Заранее резолвит DNS и открывает TCP+TLS соединения, чтобы первый поиск не платил за рукопожатие"""
+        async def _touch(host, client):
+            try:
+                await client.head(f"https://{host}/", timeout=5)
+            except Exception as e:
+                log.warning(f"Прогрев соединения с {host} не удался: {e}")
+
+        await asyncio.gather(*(_touch(host, client) for host, client in self.clients.items()))
+        log.info(f"HTTP пул провайдеров прогрет ({len(self.clients)} хостов)")
+
+    async def install_transport(self, transport):
+        """Пересоздает клиенты поверх заданного транспорта httpx (None — вернуть сетевой транспорт)"""
+        await self.close()
+        self.transport = transport
+
+    async def close(self):
+        clients, self.clients = self.clients, {}
+        await asyncio.gather(*(client.aclose() for client in clients.values()), return_exceptions=True)
+
+
+http_pool = ProviderHttpPool()
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+from core.config import settings
+from db.session import db
+
+log = logging.getLogger(__name__)
+
+
+class LeaderElection:
+    """
+    Выбор лидера среди воркеров через именованную блокировку MySQL (GET_LOCK) на отдельном соединении.
+    Лидер раз в LEADER_HEARTBEAT_INTERVAL проверяет, что блокировка все еще за ним; остальные с тем же
+    периодом пытаются ее взять. Если лидер падает, MySQL снимает блокировку вместе с соединением,
+    и новый лидер выбирается за один-два интервала.
+    on_elected / on_demoted — корутинные функции, запускающие и останавливающие работу лидера.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.conn = None
+        self.is_leader = False
+        self.task = None
+        self.on_elected = []
+        self.on_demoted = []
+
+    async def start(self):
+        if not settings.LEADER_ELECTION_ENABLED:
+            await self._become_leader()
+            return
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await self._step_down()
+
+    async def _run(self):
+        while True:
+            try:
+                if self.is_leader:
+                    await self._heartbeat()
+                else:
+                    await self._try_acquire()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error(f"LeaderElection error: {e}", exc_info=True)
+                await self._step_down()
+            await asyncio.sleep(settings.LEADER_HEARTBEAT_INTERVAL)
+
+    async def _query(self, sql, params):
+        async with self.conn.cursor() as cur:
+            await cur.execute(sql, params)
+            (value,) = await cur.fetchone()
+            return value
+
+    async def _try_acquire(self):
+        if self.conn is None:
+            self.conn = await db.connect_single()
+        if await self._query("SELECT GET_LOCK(%s, 0)", (self.name,)) == 1:
+            await self._become_leader()
+
+    async def _heartbeat(self):
+        if await self._query("SELECT IS_USED_LOCK(%s) = CONNECTION_ID()", (self.name,)) != 1:
+            log.warning("LeaderElection: блокировка лидера потеряна")
+            await self._step_down()
+
+    async def _become_leader(self):
+        self.is_leader = True
+        log.info("LeaderElection: процесс стал лидером")
+        for callback in self.on_elected:
+            await callback()
+
+    async def _step_down(self):
+        if self.is_leader:
+            self.is_leader = False
+            log.info("LeaderElection: процесс больше не лидер")
+            for callback in self.on_demoted:
+                try:
+                    await callback()
+                except Exception as e:
+                    log.error(f"LeaderElection: ошибка остановки задач лидера: {e}", exc_info=True)
+        if self.conn is not None:
+            # Закрытие соединения снимает блокировку, если она еще была за нами
+            self.conn.close()
+            self.conn = None
+
+
+leader = LeaderElection(settings.LEADER_LOCK_NAME)
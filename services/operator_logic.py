@@ -1,43 +1,137 @@
 import asyncio
-from db.repository import get_online_operators, get_active_tasks_count, get_oldest_pending_task, get_online_security_officers, get_active_security_tasks_count
+from contextlib import asynccontextmanager
+from datetime import datetime
+from core.config import settings
+from core.constants import ROLE_TASK_CAPACITY, EMPLOYEE_TASK_CAPACITY, SECURITY_TO_GROUPS
+from db.locks import advisory_lock
+from db.repository import get_operators_load, get_security_officers_load, create_task_log, create_security_task
+from services.operator_state import operator_registry
+
+
+def task_capacity(personal_telegram_id, role: str) -> int:
+    """Сколько задач сотрудник может вести одновременно: персонально, по роли или по умолчанию"""
+    capacity = EMPLOYEE_TASK_CAPACITY.get(str(personal_telegram_id))
+    if capacity is None:
+        capacity = ROLE_TASK_CAPACITY.get(role, settings.DEFAULT_TASK_CAPACITY)
+    return capacity
+
+
+def operator_capacity(personal_telegram_id) -> int:
+    return task_capacity(personal_telegram_id, "Operator")
+
+
+def free_by_capacity(rows, role: str, tie_key, count_assigned: bool = False):
+    """Сотрудники с запасом емкости, от большего запаса к меньшему; при равенстве — по tie_key"""
+    free = [
+        (
+            task_capacity(row['personal_telegram_id'], role) - int(row['active_count'])
+            - (int(row.get('pending_count') or 0) if count_assigned else 0),
+            row,
+        )
+        for row in rows
+    ]
+    free = [(remaining, row) for remaining, row in free if remaining > 0]
+    free.sort(key=lambda item: (-item[0], tie_key(item[1])))
+    return [row for _, row in free]
+
+
+def db_lock_mode() -> bool:
+    return settings.ASSIGNMENT_LOCK_MODE == "db"
+
+
+def registry_authoritative() -> bool:
+    """
+    Можно ли отвечать по реестру процесса. При нескольких воркерах (режим db) обновления и назначения
+    приходят и в другие процессы — их видит только БД
+    """
+    return operator_registry.loaded and not db_lock_mode()
+
+
+class AssignmentLock:
+    """
+    Сериализует выбор сотрудника и запись задачи.
+    В режиме ASSIGNMENT_LOCK_MODE = "db" поверх локального asyncio.Lock берется именованная блокировка MySQL,
+    общая для всех воркеров: выбор читается из БД и задача записывается, пока блокировка удерживается.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.local = asyncio.Lock()
+
+    @asynccontextmanager
+    async def hold(self):
+        async with self.local:
+            if db_lock_mode():
+                async with advisory_lock(f"cryptoops:assign:{self.name}", settings.ASSIGNMENT_LOCK_TIMEOUT):
+                    yield
+            else:
+                yield
+
 
 class TaskBalancer:
     def __init__(self):
-        self.lock = asyncio.Lock()
+        self.lock = AssignmentLock("operators")
 
-    async def get_available_operator(self):
-        """Находит оператора, который онлайн и у которого 0 активных (не на паузе) задач"""
-        async with self.lock:
-            online_ops = await get_online_operators()
-            if not online_ops:
-                return None
+    async def free_operators(self, count_assigned: bool = False):
+        """
+        Операторы с запасом емкости, лучший первым. Вызывать под self.lock.hold().
+        В режиме db состояние читается из БД: реестр процесса не видит назначений других воркеров.
+        """
+        if registry_authoritative():
+            return [op.as_row() for op in operator_registry.free_operators(operator_capacity, count_assigned)]
+        # Один запрос — онлайн операторы + количество их задач (LEFT JOIN)
+        rows = await get_operators_load()
+        return free_by_capacity(rows, "Operator", lambda row: int(row['paused_count']), count_assigned)
+
+    @staticmethod
+    def prefer(free, preferred=None):
+        if preferred is not None:
+            match = next((row for row in free if str(row['personal_telegram_id']) == str(preferred)), None)
+            if match:
+                return match
+        return free[0] if free else None
+
+    async def get_available_operator(self, preferred=None):
+        """
+        Находит онлайн оператора с наибольшим запасом емкости (активных задач меньше, чем он может вести).
+        preferred — оператор, который получает задачу в первую очередь, если у него есть запас.
+        """
+        async with self.lock.hold():
+            return self.prefer(await self.free_operators(), preferred)
 
-            for op in online_ops:
-                op_id = str(op['personal_telegram_id'])
-                # Проверяем в БД, есть ли у него задачи со статусом 'active'
-                active_count = await get_active_tasks_count(op_id)
-                if active_count == 0:
-                    return op # Этот оператор свободен (у него либо нет задач, либо все на паузе)
-            
-            return None # Все заняты
+    async def assign_new_task(self, chat_id, thread_id, form_url, preferred=None):
+        """Выбирает оператора и записывает ему задачу под одной блокировкой. (оператор, id задачи) или (None, None)"""
+        async with self.lock.hold():
+            target_op = self.prefer(await self.free_operators(), preferred)
+            if not target_op:
+                return None, None
+            op_id = str(target_op['personal_telegram_id'])
+            task_id = await create_task_log(op_id, chat_id, thread_id, form_url, datetime.now())
+            operator_registry.on_assign(op_id, task_id)
+            return target_op, task_id
 
 class SecurityTaskBalancer:
     def __init__(self):
-        self.lock = asyncio.Lock()
+        self.lock = AssignmentLock("security")
 
-    async def get_available_security_officer(self):
-        """Находит сотрудника СБ, который онлайн и у которого 0 активных задач."""
-        async with self.lock:
-            online_officers = await get_online_security_officers()
-            if not online_officers:
-                return None
+    async def assign_task(self, original_task_id, client_identifier, task_type: str, is_deal_task: bool = False):
+        """
+        Выбирает онлайн сотрудника СБ с наибольшим запасом емкости (и настроенной группой), находит или создает
+        тему клиента и записывает задачу СБ под одной блокировкой — как TaskBalancer.assign_new_task,
+        иначе параллельные запросы выберут одного сотрудника по одной и той же загрузке.
+        (сотрудник, группа СБ, тема, id задачи СБ) или None, если свободных сотрудников нет.
+        """
+        from services.security_topics import find_or_create_security_topic
 
-            for officer in online_officers:
-                officer_id = str(officer['id'])
-                active_count = await get_active_security_tasks_count(officer_id)
-                if active_count == 0:
-                    return officer
-            return None
+        async with self.lock.hold():
+            free = free_by_capacity(await get_security_officers_load(), "Security", lambda row: row['id'])
+            officer = next((row for row in free if SECURITY_TO_GROUPS.get(str(row['personal_telegram_id']))), None)
+            if officer is None:
+                return None
+            security_group_id = SECURITY_TO_GROUPS[str(officer['personal_telegram_id'])]
+            topic_id = await find_or_create_security_topic(client_identifier, security_group_id, officer['id'], task_type)
+            security_task_id = await create_security_task(original_task_id, officer['id'], topic_id, is_deal_task)
+            return officer, security_group_id, topic_id, security_task_id
 
 balancer = TaskBalancer()
 security_balancer = SecurityTaskBalancer()
\ No newline at end of file
@@ -0,0 +1,189 @@
+import asyncio
+import logging
+from datetime import datetime
+from core.config import settings
+from db.repository import get_operators_snapshot
+
+log = logging.getLogger(__name__)
+
+
+class OperatorState:
+    """Состояние одного оператора: онлайн-статус, назначенные, активные задачи и задачи на паузе"""
+
+    def __init__(self, tg_id: str, username: str = None, online: bool = False):
+        self.tg_id = tg_id
+        self.username = username
+        self.online = online
+        self.active = {}  # task_id -> assigned_at
+        self.paused = set()
+        self.assigned = set()  # назначены, но еще не приняты
+        self.threads = {}  # task_id -> operator_thread_id (топик задачи в группе оператора)
+
+    @property
+    def active_count(self) -> int:
+        return len(self.active)
+
+    def as_row(self) -> dict:
+        return {
+            "personal_telegram_id": self.tg_id,
+            "personal_telegram_username": self.username,
+            "active_count": self.active_count,
+            "paused_count": len(self.paused),
+        }
+
+
+class OperatorRegistry:
+    """
+    Состояние операторов в памяти процесса.
+    Загружается при старте, обновляется событиями обработчиков (назначение, принятие, пауза,
+    продолжение, завершение) и периодически сверяется с БД (OPERATOR_RECONCILE_INTERVAL):
+    онлайн-статус меняется вне приложения и попадает сюда только при сверке.
+    """
+
+    def __init__(self):
+        self.operators = {}
+        self.loaded = False
+        self.events = 0
+        self.task = None
+        self.on_online = []  # колбэки, вызываемые, когда оператор выходит онлайн
+
+    async def start(self):
+        await self.reconcile()
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.OPERATOR_RECONCILE_INTERVAL)
+            try:
+                await self.reconcile()
+            except Exception as e:
+                log.error(f"OperatorRegistry reconcile error: {e}", exc_info=True)
+
+    async def reconcile(self):
+        """Перечитывает состояние из БД. Если во время чтения пришли события, снимок устарел и отбрасывается"""
+        events_before = self.events
+        rows = await get_operators_snapshot()
+        if self.loaded and self.events != events_before:
+            log.info("OperatorRegistry: снимок устарел во время чтения, сверка отложена")
+            return
+
+        operators = {}
+        for row in rows:
+            tg_id = str(row['personal_telegram_id'])
+            op = operators.get(tg_id)
+            if op is None:
+                op = operators[tg_id] = OperatorState(tg_id, row['personal_telegram_username'], row['status'] == 'online')
+            if row['task_id'] is None:
+                continue
+            op.threads[row['task_id']] = row['operator_thread_id']
+            if row['task_status'] == 'active':
+                op.active[row['task_id']] = row['assigned_at']
+            elif row['task_status'] == 'paused':
+                op.paused.add(row['task_id'])
+            elif row['task_status'] == 'pending':
+                op.assigned.add(row['task_id'])
+
+        came_online = [
+            tg_id for tg_id, op in operators.items()
+            if op.online and not (tg_id in self.operators and self.operators[tg_id].online)
+        ]
+        was_loaded = self.loaded
+        self.operators = operators
+        self.loaded = True
+        if was_loaded:
+            for tg_id in came_online:
+                for callback in self.on_online:
+                    callback(tg_id)
+
+    def _get(self, op_id) -> OperatorState:
+        op_id = str(op_id)
+        op = self.operators.get(op_id)
+        if op is None:
+            op = self.operators[op_id] = OperatorState(op_id)
+        return op
+
+    # --- События жизненного цикла задач ---
+
+    def on_accept(self, op_id, task_id, assigned_at=None, thread_id=None):
+        self.events += 1
+        op = self._get(op_id)
+        op.assigned.discard(task_id)
+        op.paused.discard(task_id)
+        op.active[task_id] = assigned_at
+        if thread_id is not None:
+            op.threads[task_id] = thread_id
+
+    on_resume = on_accept
+
+    def on_pause(self, op_id, task_id):
+        self.events += 1
+        op = self._get(op_id)
+        op.active.pop(task_id, None)
+        op.paused.add(task_id)
+
+    def on_complete(self, op_id, task_id):
+        self.events += 1
+        op = self._get(op_id)
+        op.active.pop(task_id, None)
+        op.paused.discard(task_id)
+        op.assigned.discard(task_id)
+        op.threads.pop(task_id, None)
+
+    def on_assign(self, op_id, task_id):
+        # Назначенная, но не принятая задача не считается активной (как и в БД)
+        self.events += 1
+        self._get(op_id).assigned.add(task_id)
+
+    def on_unassign(self, op_id, task_id):
+        self.events += 1
+        op = self._get(op_id)
+        op.assigned.discard(task_id)
+        op.threads.pop(task_id, None)
+
+    # --- Запросы горячего пути ---
+
+    def active_count(self, op_id):
+        """Количество активных задач оператора или None, если состояние еще не загружено"""
+        if not self.loaded:
+            return None
+        op = self.operators.get(str(op_id))
+        return op.active_count if op else 0
+
+    def free_operators(self, capacity, count_assigned: bool = False):
+        """
+        Онлайн операторы с запасом емкости (capacity(tg_id) минус активные задачи), от большего запаса
+        к меньшему, при равенстве — от меньшего числа задач на паузе.
+        count_assigned — учитывать и задачи, назначенные, но еще не принятые.
+        """
+        free = []
+        for op in self.operators.values():
+            remaining = capacity(op.tg_id) - op.active_count - (len(op.assigned) if count_assigned else 0)
+            if op.online and remaining > 0:
+                free.append((remaining, op))
+        free.sort(key=lambda item: (-item[0], len(item[1].paused)))
+        return [op for _, op in free]
+
+    def active_task_ids(self, op_id):
+        """Активные задачи оператора, от последней назначенной к первой (как get_last_active_task)"""
+        op = self.operators.get(str(op_id))
+        if not op:
+            return []
+        return sorted(op.active, key=lambda task_id: (op.active[task_id] or datetime.min, task_id), reverse=True)
+
+    def active_task_for_thread(self, op_id, thread_id):
+        """Активная задача оператора, чей топик — thread_id, иначе последняя назначенная; None — если активных нет"""
+        task_ids = self.active_task_ids(op_id)
+        if not task_ids:
+            return None
+        threads = self.operators[str(op_id)].threads
+        return next((task_id for task_id in task_ids if threads.get(task_id) == thread_id), task_ids[0])
+
+
+operator_registry = OperatorRegistry()
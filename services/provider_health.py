@@ -0,0 +1,230 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+from core.config import settings
+
+log = logging.getLogger(__name__)
+
+# Лимиты провайдеров: rate — запросов в секунду, burst — размер "ведра",
+# daily — суточный бюджет запросов (None — без ограничения)
+PROVIDER_LIMITS = {
+    "api.blockchair.com": {"rate": 0.5, "burst": 5, "daily": 1440},
+    "api.ethplorer.io": {"rate": 2.0, "burst": 2, "daily": None},
+    "tonapi.io": {"rate": 1.0, "burst": 1, "daily": None},
+    "apilist.tronscan.org": {"rate": 5.0, "burst": 5, "daily": 100000},
+    "blockchain.info": {"rate": 1.0, "burst": 3, "daily": None},
+    "explorer.monero.ovh": {"rate": 1.0, "burst": 2, "daily": None},
+    "xmrscan.org": {"rate": 1.0, "burst": 2, "daily": None},
+}
+DEFAULT_LIMITS = {"rate": 1.0, "burst": 2, "daily": None}
+
+# Коды ответа, означающие "провайдер не готов отвечать", а не "транзакции нет"
+THROTTLE_STATUSES = (402, 429)
+
+
+class ProviderUnavailable(Exception):
+    """Провайдер не ответил по существу: лимит, открытый circuit breaker, 402/429/5xx или сетевая ошибка"""
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, max_wait: float) -> bool:
+        """Берет токен, при необходимости ожидая его. False — если ждать пришлось бы дольше max_wait"""
+        deadline = time.monotonic() + max_wait
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            wait = (1 - self.tokens) / self.rate
+            if time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int, window: float, recovery_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.window = window
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.failures = []
+        self.open_until = 0.0
+        self.probe_in_flight = False
+        self.probe_started = 0.0
+
+    def allow(self) -> bool:
+        """
+        Можно ли отправить запрос. После паузы пропускает один пробный запрос (half-open).
+        Пробный запрос без результата дольше recovery_timeout считается потерянным — пропускается следующий
+        """
+        if self.state == self.CLOSED:
+            return True
+        now = time.monotonic()
+        if self.state == self.OPEN:
+            if now < self.open_until:
+                return False
+            self.state = self.HALF_OPEN
+            self.probe_in_flight = False
+        if self.probe_in_flight and now - self.probe_started < self.recovery_timeout:
+            return False
+        self.probe_in_flight = True
+        self.probe_started = now
+        return True
+
+    def release_probe(self):
+        """Пробный запрос не дал результата (отменен, не дождался rate limit) — слот свободен"""
+        self.probe_in_flight = False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures.clear()
+        self.probe_in_flight = False
+
+    def record_failure(self):
+        now = time.monotonic()
+        if self.state == self.HALF_OPEN:
+            self.trip(self.recovery_timeout)
+            return
+        self.failures = [t for t in self.failures if now - t < self.window]
+        self.failures.append(now)
+        if len(self.failures) >= self.failure_threshold:
+            self.trip(self.recovery_timeout)
+
+    def trip(self, duration: float):
+        self.state = self.OPEN
+        self.open_until = time.monotonic() + duration
+        self.failures.clear()
+        self.probe_in_flight = False
+
+
+class ProviderState:
+    """Лимиты, квота и статистика одного хоста провайдера"""
+
+    def __init__(self, host: str, limits: dict):
+        self.host = host
+        self.bucket = TokenBucket(limits["rate"], limits["burst"])
+        self.breaker = CircuitBreaker(
+            settings.BREAKER_FAILURE_THRESHOLD,
+            settings.BREAKER_WINDOW,
+            settings.BREAKER_RECOVERY_TIMEOUT,
+        )
+        self.daily_budget = limits["daily"]
+        self.day = None
+        self.requests_today = 0
+        # Экспоненциально сглаженные задержка (сек.) и доля успешных ответов
+        self.latency = None
+        self.success_rate = 1.0
+
+    def count_request(self):
+        today = datetime.now(timezone.utc).date()
+        if self.day != today:
+            self.day, self.requests_today = today, 0
+        self.requests_today += 1
+
+    def budget_exhausted(self) -> bool:
+        today = datetime.now(timezone.utc).date()
+        return (
+            self.daily_budget is not None
+            and self.day == today
+            and self.requests_today >= self.daily_budget
+        )
+
+    def observe(self, ok: bool, latency: float = None, alpha: float = 0.2):
+        self.success_rate = (1 - alpha) * self.success_rate + alpha * (1.0 if ok else 0.0)
+        if latency is not None:
+            self.latency = latency if self.latency is None else (1 - alpha) * self.latency + alpha * latency
+
+    def score(self) -> float:
+        """Чем больше, тем предпочтительнее провайдер"""
+        if self.breaker.state == CircuitBreaker.OPEN or self.budget_exhausted():
+            return -1.0
+        return self.success_rate / max(self.latency or 0.5, 0.05)
+
+    def stats(self) -> dict:
+        return {
+            "state": self.breaker.state,
+            "requests_today": self.requests_today,
+            "daily_budget": self.daily_budget,
+            "latency": round(self.latency, 3) if self.latency is not None else None,
+            "success_rate": round(self.success_rate, 3),
+        }
+
+
+class ProviderHealth:
+    """Слой здоровья провайдеров под CryptoMonitor: rate limit, суточная квота, circuit breaker, ранжирование"""
+
+    def __init__(self, limits: dict = None):
+        self.limits = PROVIDER_LIMITS if limits is None else limits
+        self.providers = {}
+
+    def state(self, host: str) -> ProviderState:
+        state = self.providers.get(host)
+        if state is None:
+            state = self.providers[host] = ProviderState(host, self.limits.get(host, DEFAULT_LIMITS))
+        return state
+
+    async def before_request(self, host: str):
+        """Резервирует запрос к хосту или бросает ProviderUnavailable, не тратя время на заведомо пустой запрос"""
+        state = self.state(host)
+        if state.budget_exhausted():
+            raise ProviderUnavailable(f"{host}: суточный лимит запросов исчерпан")
+        if not state.breaker.allow():
+            raise ProviderUnavailable(f"{host}: circuit breaker открыт")
+        try:
+            acquired = await state.bucket.acquire(settings.PROVIDER_MAX_QUEUE_WAIT)
+        except BaseException:
+            # Отмена во время ожидания токена
+            state.breaker.release_probe()
+            raise
+        if not acquired:
+            # Пробный запрос half-open не состоялся — освобождаем слот
+            state.breaker.release_probe()
+            raise ProviderUnavailable(f"{host}: превышен rate limit")
+        state.count_request()
+
+    def burst(self, host: str) -> int:
+        """Сколько запросов к хосту можно отправить разом, не упираясь в rate limit"""
+        return max(1, int(self.state(host).bucket.capacity))
+
+    def release_probe(self, host: str):
+        """Запрос не дал ни успеха, ни ошибки (например, отменен) — освобождает пробный слот half-open"""
+        self.state(host).breaker.release_probe()
+
+    def record_success(self, host: str, latency: float):
+        state = self.state(host)
+        state.breaker.record_success()
+        state.observe(True, latency)
+
+    def record_failure(self, host: str, latency: float = None, retry_after: float = None):
+        state = self.state(host)
+        state.observe(False, latency)
+        if retry_after is not None:
+            state.breaker.trip(retry_after)
+            log.warning(f"Провайдер {host} ограничил запросы, пауза {retry_after:.0f} сек.")
+        else:
+            state.breaker.record_failure()
+
+    def rank(self, urls):
+        """Сортирует URL провайдеров по недавней задержке и доле успешных ответов"""
+        return sorted(urls, key=lambda url: self.state(urlsplit(url).hostname).score(), reverse=True)
+
+    def stats(self) -> dict:
+        return {host: state.stats() for host, state in self.providers.items()}
+
+
+provider_health = ProviderHealth()
@@ -0,0 +1,68 @@
+import asyncio
+import logging
+from core.cache import TTLCache
+from core.config import settings
+from db.repository import get_security_topic, save_security_topic
+from db.session import db
+from services.bot_service import bot
+
+log = logging.getLogger(__name__)
+
+
+class SecurityTopicResolver:
+    """
+    Темы клиентов в чате СБ: client_identifier -> topic_id.
+    Кэш в памяти с записью в БД при создании; заголовок меняется, только если он отличается
+    от последнего выставленного; параллельные вызовы для одного клиента ждут одного создания темы.
+    Соединение с БД не удерживается во время запросов к Telegram.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.cache = TTLCache(maxsize, ttl)  # client_identifier -> {"topic_id", "title"}
+        self.inflight = {}
+
+    async def find_or_create(self, client_identifier, security_group_id: int, officer_id: int, task_type: str) -> int:
+        """Ищет тему для клиента в чате СБ, создает новую или переименовывает существующую."""
+        key = str(client_identifier)
+        topic_title = f"{task_type} | Клиент: {client_identifier}"
+
+        entry = self.cache.get(key)
+        if entry is None:
+            future = self.inflight.get(key)
+            if future is None:
+                future = self.inflight[key] = asyncio.ensure_future(
+                    self._load_or_create(key, security_group_id, officer_id, topic_title)
+                )
+                future.add_done_callback(lambda _: self.inflight.pop(key, None))
+            entry = await asyncio.shield(future)
+
+        if entry["title"] != topic_title:
+            try:
+                # Переименовываем существующую тему
+                await bot.edit_forum_topic(chat_id=security_group_id, message_thread_id=entry["topic_id"], name=topic_title)
+                entry["title"] = topic_title
+            except Exception as e:
+                # Логируем ошибку, если не удалось переименовать, но продолжаем работу
+                log.warning(f"Could not rename topic {entry['topic_id']}: {e}")
+        return entry["topic_id"]
+
+    async def _load_or_create(self, key, security_group_id: int, officer_id: int, topic_title: str) -> dict:
+        # Результат общий для нескольких вызывающих — не используем соединение чьей-то единицы работы
+        async with db.detached():
+            existing = await get_security_topic(key)
+            if existing:
+                # Заголовок темы в БД не хранится — после перезапуска первое обращение его выставит
+                entry = {"topic_id": existing['topic_id'], "title": None}
+            else:
+                topic = await bot.create_forum_topic(chat_id=security_group_id, name=topic_title)
+                await save_security_topic(key, security_group_id, officer_id, topic.message_thread_id)
+                entry = {"topic_id": topic.message_thread_id, "title": topic_title}
+        self.cache.set(key, entry)
+        return entry
+
+
+security_topics = SecurityTopicResolver(settings.SECURITY_TOPIC_CACHE_MAXSIZE, settings.SECURITY_TOPIC_CACHE_TTL)
+
+
+async def find_or_create_security_topic(client_identifier, security_group_id: int, officer_id: int, task_type: str) -> int:
+    return await security_topics.find_or_create(client_identifier, security_group_id, officer_id, task_type)
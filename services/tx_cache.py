@@ -0,0 +1,46 @@
+from core.cache import TTLCache
+from core.config import settings
+from services.tx_classifier import EVM_HASH_RE, HEX_HASH_RE
+from services.addresses import canonical
+
+
+class TxLookupCache:
+    """
+    Кэш результатов поиска транзакций перед CryptoMonitor.
+    Найденные транзакции неизменяемы и хранятся долго, ключ — (хэш, кошелек).
+    Отрицательный результат хранится коротко и отдельно по каждой сети: (хэш, кошелек, сеть).
+    """
+
+    def __init__(self, maxsize: int, found_ttl: float, not_found_ttl: float):
+        self.found = TTLCache(maxsize, found_ttl)
+        self.not_found = TTLCache(maxsize, not_found_ttl)
+
+    @staticmethod
+    def key(tx_hash, target_wallet=None):
+        """Нормализованный ключ: hex-хэши не зависят от регистра, base64 (TON) — зависят; кошелек — в канонической форме"""
+        tx_hash = (tx_hash or "").strip()
+        if EVM_HASH_RE.match(tx_hash) or HEX_HASH_RE.match(tx_hash):
+            tx_hash = tx_hash.lower()
+        return tx_hash, canonical(target_wallet)
+
+    def get(self, tx_hash, target_wallet=None):
+        return self.found.get(self.key(tx_hash, target_wallet))
+
+    def put(self, tx_hash, target_wallet, result):
+        self.found.set(self.key(tx_hash, target_wallet), result)
+
+    def is_not_found(self, tx_hash, target_wallet, chain) -> bool:
+        return self.not_found.get(self.key(tx_hash, target_wallet) + (chain,)) is not None
+
+    def mark_not_found(self, tx_hash, target_wallet, chain):
+        self.not_found.set(self.key(tx_hash, target_wallet) + (chain,), True)
+
+    def stats(self) -> dict:
+        return {"found": self.found.stats(), "not_found": self.not_found.stats()}
+
+
+tx_cache = TxLookupCache(
+    maxsize=settings.TX_CACHE_MAXSIZE,
+    found_ttl=settings.TX_CACHE_FOUND_TTL,
+    not_found_ttl=settings.TX_CACHE_NOT_FOUND_TTL,
+)
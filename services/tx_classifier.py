@@ -0,0 +1,69 @@
+import re
+
+# Порядок сетей определяет порядок запуска проверок в CryptoMonitor.search_tx
+EVM_CHAINS = ("ethereum", "base", "bsc", "arbitrum", "polygon")
+NON_EVM_CHAINS = ("ton", "tron", "bitcoin", "dogecoin", "monero")
+ALL_CHAINS = EVM_CHAINS + NON_EVM_CHAINS
+
+# --- Форматы хэшей транзакций ---
+# 0x + 64 hex: Ethereum и все EVM сети
+EVM_HASH_RE = re.compile(r"^0x[0-9a-fA-F]{64}$")
+# 64 hex без префикса: TRON, Bitcoin, Dogecoin, Monero и hex-вид хэша TON
+HEX_HASH_RE = re.compile(r"^[0-9a-fA-F]{64}$")
+# base64 / base64url от 32 байт (43 символа без паддинга, 44 с "="): только TON
+B64_HASH_RE = re.compile(r"^[A-Za-z0-9+/_-]{43}=?$")
+
+# --- Форматы адресов кошельков (подсказка для сужения списка сетей) ---
+EVM_ADDR_RE = re.compile(r"^0x[0-9a-fA-F]{40}$")
+TRON_ADDR_RE = re.compile(r"^(T[1-9A-HJ-NP-Za-km-z]{33}|41[0-9a-fA-F]{40})$")
+BTC_ADDR_RE = re.compile(r"^([13][1-9A-HJ-NP-Za-km-z]{25,34}|bc1[02-9ac-hj-np-z]{11,71})$", re.IGNORECASE)
+DOGE_ADDR_RE = re.compile(r"^[DA9][1-9A-HJ-NP-Za-km-z]{25,34}$")
+XMR_ADDR_RE = re.compile(r"^[48][1-9A-HJ-NP-Za-km-z]{94}([1-9A-HJ-NP-Za-km-z]{11})?$")
+TON_ADDR_RE = re.compile(r"^([EUk0]Q[A-Za-z0-9_-]{46}|-?\d+:[0-9a-fA-F]{64})$")
+
+
+def chains_for_hash(tx_hash):
+    """Возвращает сети, в которых может существовать транзакция с таким хэшем (по длине, алфавиту и кодировке)"""
+    tx_hash = (tx_hash or "").strip()
+    if EVM_HASH_RE.match(tx_hash):
+        return EVM_CHAINS
+    if HEX_HASH_RE.match(tx_hash):
+        return NON_EVM_CHAINS
+    if B64_HASH_RE.match(tx_hash):
+        return ("ton",)
+    return ()
+
+
+def chains_for_wallet(wallet):
+    """Возвращает сети, которым соответствует формат адреса кошелька (пустой кортеж, если формат неизвестен)"""
+    wallet = (wallet or "").strip()
+    if not wallet:
+        return ()
+    if EVM_ADDR_RE.match(wallet):
+        return EVM_CHAINS
+    if TON_ADDR_RE.match(wallet):
+        return ("ton",)
+    if TRON_ADDR_RE.match(wallet):
+        return ("tron",)
+    if XMR_ADDR_RE.match(wallet):
+        return ("monero",)
+    if DOGE_ADDR_RE.match(wallet):
+        return ("dogecoin",)
+    if BTC_ADDR_RE.match(wallet):
+        return ("bitcoin",)
+    return ()
+
+
+def candidate_chains(tx_hash, target_wallet=None):
+    """
+    Определяет, какие сети имеет смысл опрашивать для данного хэша.
+    Формат кошелька получателя (если он известен) дополнительно сужает список.
+    Если подсказка по кошельку противоречит хэшу, она игнорируется.
+    """
+    by_hash = chains_for_hash(tx_hash)
+    by_wallet = chains_for_wallet(target_wallet)
+    if by_wallet:
+        narrowed = tuple(chain for chain in by_hash if chain in by_wallet)
+        if narrowed:
+            return narrowed
+    return by_hash
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import re
+from datetime import datetime
+from core.config import settings
+from core.constants import OPERATORS_TO_GROUPS, TOKEN_CONTRACTS
+from db.repository import get_watchable_tasks
+from services.bot_service import BotService, bot
+from services.crypto_monitor import CryptoMonitor
+from services.dispatcher import dispatcher
+from services.provider_health import ProviderUnavailable
+
+log = logging.getLogger(__name__)
+
+# Символы, которые WalletWatcher умеет сверять: монеты сетей и токены из TOKEN_CONTRACTS
+WATCHED_SYMBOLS = {"BTC", "ETH", "TRX", "TON"} | {s for tokens in TOKEN_CONTRACTS.values() for s in tokens.values()}
+SYMBOL_RE = re.compile(r"[A-Z]+")
+
+
+def expected_symbol(task):
+    """
+    Криптовалюта оплаты по сделке задачи ("USDT TRC20" -> "USDT"): та из currency_to_get / currency_to_give,
+    что есть в WATCHED_SYMBOLS. None — сделки нет или валюта не распознана (такая задача не завершается сама)
+    """
+    for currency in (task.get('currency_to_get'), task.get('currency_to_give')):
+        for word in SYMBOL_RE.findall(str(currency or "").upper()):
+            if word in WATCHED_SYMBOLS:
+                return word
+    return None
+
+
+class AddressCursor:
+    """Инкрементальный курсор по адресу: время последнего перевода и уже обработанные хэши на этой границе"""
+
+    def __init__(self, since_ts: float):
+        self.since_ts = since_ts
+        self.seen = set()
+
+    def new_transfers(self, transfers):
+        fresh = [t for t in transfers if t["ts"] >= self.since_ts and t["tx_hash"] not in self.seen]
+        for t in fresh:
+            if t["ts"] > self.since_ts:
+                self.since_ts, self.seen = t["ts"], set()
+            self.seen.add(t["tx_hash"])
+        return fresh
+
+
+class WalletWatcher:
+    """
+    Фоновое отслеживание входящих платежей на кошельки задач в работе.
+    Периодически опрашивает историю адресов (CryptoMonitor.incoming_transfers), сверяет новые переводы
+    с expected_amount и завершает задачу так же, как verify_transaction.
+    """
+
+    def __init__(self, monitor: CryptoMonitor):
+        self.monitor = monitor
+        self.cursors = {}
+        self.task = None
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+            log.info("WalletWatcher started")
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.poll()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error(f"WalletWatcher error: {e}", exc_info=True)
+            await asyncio.sleep(settings.WALLET_WATCH_INTERVAL)
+
+    async def poll(self):
+        """Один проход: новые переводы по каждому отслеживаемому кошельку"""
+        by_wallet, seen = {}, set()
+        for task in await get_watchable_tasks():
+            # Несколько сделок в одном топике дают повторы задачи
+            if task['id'] in seen:
+                continue
+            seen.add(task['id'])
+            by_wallet.setdefault(task['wallet_address'].strip(), []).append(task)
+
+        # Кошельки без задач в работе больше не отслеживаем
+        for wallet in set(self.cursors) - set(by_wallet):
+            del self.cursors[wallet]
+
+        semaphore = asyncio.Semaphore(settings.WALLET_WATCH_CONCURRENCY)
+
+        async def _check(wallet, tasks):
+            async with semaphore:
+                await self.check_wallet(wallet, tasks)
+
+        await asyncio.gather(*(_check(wallet, tasks) for wallet, tasks in by_wallet.items()))
+
+    async def check_wallet(self, wallet, tasks):
+        cursor = self.cursors.get(wallet)
+        if cursor is None:
+            # Платеж ожидается не раньше, чем задача была создана
+            since = min((t['assigned_at'] for t in tasks if t.get('assigned_at')), default=datetime.now())
+            cursor = self.cursors[wallet] = AddressCursor(since.timestamp())
+
+        try:
+            transfers = await self.monitor.incoming_transfers(wallet, cursor.since_ts)
+        except ProviderUnavailable as e:
+            log.warning(f"WalletWatcher: {wallet}: {e}")
+            return
+        except Exception as e:
+            log.error(f"WalletWatcher: ошибка получения переводов {wallet}: {e}")
+            return
+
+        waiting = [t for t in tasks if expected_symbol(t)]
+        for transfer in cursor.new_transfers(transfers):
+            matches = [
+                t for t in waiting
+                if expected_symbol(t) == transfer['symbol']
+                and abs(transfer['amount'] - float(t['expected_amount'])) < settings.AMOUNT_TOLERANCE
+            ]
+            if not matches:
+                continue
+            if len(matches) > 1:
+                # Общий кошелек и одинаковые суммы: какую задачу оплатили, решает оператор (verify_transaction)
+                log.warning(
+                    f"WalletWatcher: перевод {transfer['tx_hash']} подходит к нескольким задачам "
+                    f"({', '.join(str(t['id']) for t in matches)}), автоматически не завершается"
+                )
+                continue
+            task = matches[0]
+            waiting.remove(task)
+            self.monitor.cache.put(transfer['tx_hash'], wallet, transfer)
+            await self.complete(task, transfer)
+
+    async def complete(self, task, transfer):
+        """Завершает задачу по найденному платежу и уведомляет оператора в его топике"""
+        op_id = str(task['operator_id'])
+        # Задачу могли завершить вручную (verify_transaction) или поставить на другое, пока шел опрос
+        if not await BotService.complete_task(task['id'], op_id, from_statuses=('active', 'paused')):
+            log.info(f"WalletWatcher: задача #{task['id']} уже не в работе, платеж {transfer['tx_hash']} пропущен")
+            return
+        log.info(f"WalletWatcher: задача #{task['id']} оплачена транзакцией {transfer['tx_hash']}")
+
+        op_group = OPERATORS_TO_GROUPS.get(op_id)
+        if op_group:
+            reply_text = BotService.format_tx_report(transfer, float(task['expected_amount']))
+            await bot.send_message(
+                chat_id=op_group,
+                message_thread_id=task.get('operator_thread_id'),
+                text=reply_text + "\n✅ <b>Платеж поступил на кошелек. Задача завершена автоматически.</b>",
+                parse_mode="HTML"
+            )
+        dispatcher.kick()
+
+
+wallet_watcher = WalletWatcher(CryptoMonitor())